@@ -1,5 +1,8 @@
-from iebank_api import app
+from iebank_api import create_app
 import os
 
+app = create_app()
+
+# Development server only; production runs `gunicorn app:app` with gunicorn.conf.py
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8000)))
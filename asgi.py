@@ -0,0 +1,7 @@
+from iebank_api import create_app
+from iebank_api.asgi import AsyncAPI
+
+# Async serving mode: GET /accounts, /transactions and /user_portal run on an async
+# engine (aiosqlite / asyncpg), every other route on the Flask app. Serve with e.g.
+#   uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+app = AsyncAPI(create_app())
@@ -0,0 +1,166 @@
+"""Async serving benchmark.
+
+Seeds a throwaway database, then serves the API once with gunicorn (one sync
+worker with a fixed number of threads, app.py) and once with uvicorn (one
+worker, asgi.py) and drives GET /accounts, /transactions and /user_portal at
+increasing client concurrency against each, reporting req/s and latency.
+
+    python benchmarks/async_reads.py --concurrency 1 16 64 --duration 10
+
+The database defaults to a temporary SQLite file; pass --database-uri to run
+against PostgreSQL (where queries wait on the network and async pays off).
+"""
+import argparse
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+PATHS = ['/accounts?limit=20', '/transactions?limit=20', '/user_portal']
+
+
+def seed(database_uri, accounts, transactions):
+    os.environ['SQLALCHEMY_DATABASE_URI'] = database_uri
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    from werkzeug.security import generate_password_hash
+    from datetime import datetime
+    from iebank_api import create_app, db
+    from iebank_api.models import Account, Transaction, User
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if User.query.filter_by(username='benchuser').first():
+            return
+        user = User(username='benchuser', email='benchuser@example.com',
+                    password=generate_password_hash('benchpass', method='pbkdf2:sha256'),
+                    country='Spain', date_of_birth=datetime(1990, 1, 1))
+        db.session.add(user)
+        db.session.flush()
+        rows = [Account(name=f'Account {i}', balance=1000, currency='USD', country='Spain', user_id=user.id) for i in range(accounts)]
+        db.session.add_all(rows)
+        db.session.flush()
+        db.session.add_all(
+            Transaction(from_account_id=rows[i % accounts].id, to_account_id=rows[(i + 1) % accounts].id, amount=1, currency='USD')
+            for i in range(transactions)
+        )
+        db.session.commit()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(command, port, env):
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{command[2]} did not start')
+
+
+def call(url, token=None, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['x-access-token'] = token
+    request = urllib.request.Request(url, data=data, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def load(base_url, token, clients, duration):
+    stop = threading.Event()
+    latencies = []
+    errors = []
+    paths = itertools.cycle(PATHS)
+
+    def client():
+        while not stop.is_set():
+            path = next(paths)
+            start = time.perf_counter()
+            status, _ = call(f'{base_url}{path}', token)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {
+        'req/s': len(latencies) / duration,
+        'p50 ms': percentile(latencies, 0.50) * 1000,
+        'p95 ms': percentile(latencies, 0.95) * 1000,
+        'p99 ms': percentile(latencies, 0.99) * 1000,
+        'errors': len(errors)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    parser.add_argument('--accounts', type=int, default=50, help='accounts of the benchmark user')
+    parser.add_argument('--transactions', type=int, default=2000, help='transactions of the benchmark user')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64], help='client counts to run')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per run')
+    parser.add_argument('--threads', type=int, default=8, help='threads of the sync gunicorn worker')
+    args = parser.parse_args()
+
+    seed(args.database_uri, args.accounts, args.transactions)
+    env = dict(os.environ, SQLALCHEMY_DATABASE_URI=args.database_uri, SECRET_KEY=os.environ.get('SECRET_KEY', 'bench'))
+
+    port = free_port()
+    servers = {
+        f'sync (gunicorn, 1 worker x {args.threads} threads)':
+            [sys.executable, '-m', 'gunicorn', '--workers', '1', '--threads', str(args.threads), '--bind', f'127.0.0.1:{port}', 'app:app'],
+        'async (uvicorn, 1 worker)':
+            [sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', '1', '--port', str(port), '--log-level', 'warning']
+    }
+    for label, command in servers.items():
+        process = start_server(command, port, env)
+        try:
+            base_url = f'http://127.0.0.1:{port}'
+            _, body = call(f'{base_url}/login', body={'username': 'benchuser', 'password': 'benchpass'})
+            token = json.loads(body)['token']
+            print(f'== {label}')
+            for clients in args.concurrency:
+                results = load(base_url, token, clients, args.duration)
+                print(f'  {clients:>3} clients  ' + '  '.join(f'{key} {value:8.1f}' for key, value in results.items()))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Response compression benchmark.
+
+Seeds a throwaway SQLite database, fetches the uncompressed bodies of
+GET /transactions?limit=1000 and GET /admin_portal?limit=1000, then runs them
+through the compression hook with each content coding and level. Reports bytes
+sent, the share saved and the CPU time the hook adds to a request.
+
+    python benchmarks/compression.py --runs 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'compression.db')}"
+os.environ.setdefault('SECRET_KEY', 'bench')
+
+from flask import Response  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+from iebank_api import create_app, db  # noqa: E402
+from iebank_api.compression import brotli, compress_response  # noqa: E402
+from iebank_api.models import Account, Transaction, User  # noqa: E402
+
+# (coding, config key, levels) to measure
+SETTINGS = [
+    ('gzip', 'COMPRESSION_LEVEL', [1, 6, 9]),
+    ('br', 'COMPRESSION_BROTLI_QUALITY', [1, 4, 6, 11])
+]
+
+
+def seed(users, transactions):
+    password = generate_password_hash('benchpass', method='pbkdf2:sha256')
+    admin = User(username='benchadmin', email='benchadmin@example.com', password=password,
+                 country='Spain', date_of_birth=datetime(1980, 1, 1), role='admin')
+    db.session.add(admin)
+    db.session.add_all(User(username=f'user{i:06d}', email=f'user{i:06d}@example.com', password=password,
+                            country='Spain', date_of_birth=datetime(1990, 1, 1)) for i in range(users))
+    db.session.flush()
+    accounts = [Account(name=f'Account {i}', balance=100000, currency='USD', country='Spain', user_id=admin.id) for i in range(10)]
+    db.session.add_all(accounts)
+    db.session.flush()
+    db.session.add_all(
+        Transaction(from_account_id=accounts[i % 10].id, to_account_id=accounts[(i + 1) % 10].id, amount=i % 500 + 0.25, currency='USD')
+        for i in range(transactions)
+    )
+    db.session.commit()
+
+
+def measure(app, body, coding, runs):
+    times = []
+    for _ in range(runs):
+        with app.test_request_context(headers={'Accept-Encoding': coding}):
+            response = Response(body, mimetype='application/json')
+            start = time.process_time()
+            response = compress_response(response)
+            times.append(time.process_time() - start)
+    return len(response.get_data()), statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(args.users, args.transactions)
+
+    client = app.test_client()
+    token = client.post('/login', json={'username': 'benchadmin', 'password': 'benchpass'}).get_json()['token']
+    for path in ('/transactions?limit=1000', '/admin_portal?limit=1000'):
+        body = client.get(path, headers={'x-access-token': token}).get_data()
+        print(f'== GET {path}: {len(body) / 1024:.0f} KiB uncompressed')
+        for coding, key, levels in SETTINGS:
+            if coding == 'br' and brotli is None:
+                print('  br: brotli is not installed')
+                continue
+            for level in levels:
+                app.config[key] = level
+                size, cpu = measure(app, body, coding, args.runs)
+                print(f'  {coding:<4} level {level:>2}  {size / 1024:7.1f} KiB  saved {1 - size / len(body):6.1%}  '
+                      f'cpu {cpu * 1000:6.2f} ms/request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""JSON encoding micro-benchmark.
+
+Serializes a /transactions-style payload of formatted transactions (dicts with
+datetimes, as built by format_transaction) with Flask's default provider, the
+app's provider on the stdlib encoder and the app's provider on orjson.
+
+    python benchmarks/json_encoding.py --transactions 10000 --runs 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from iebank_api import create_app  # noqa: E402
+
+
+def payload(count):
+    start = datetime(2024, 1, 1)
+    return {
+        'transactions': [{
+            'id': i,
+            'amount': 10.25 + i % 100,
+            'currency': 'USD',
+            'status': 'Completed',
+            'created_at': start + timedelta(seconds=i, microseconds=i),
+            'from_account': f'{i:020d}',
+            'to_account': f'{i + 1:020d}'
+        } for i in range(count)],
+        'next_cursor': 'MjAyNC0wMS0wMVQwMDowMDowMHwxMDAwMA=='
+    }
+
+
+def measure(label, encode, data, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        body = encode(data)
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    print(f'  {label:<24} median {median * 1000:8.2f} ms  min {min(times) * 1000:8.2f} ms  {len(body) / 1024:8.0f} KiB')
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    data = payload(args.transactions)
+    default = DefaultJSONProvider(app)
+
+    with app.app_context():
+        print(f'== {args.transactions} transactions, {args.runs} runs')
+        baseline = measure('flask default (stdlib)', lambda obj: default.response(obj).get_data(), data, args.runs)
+        app.config['JSON_USE_ORJSON'] = False
+        stdlib = measure('app provider, stdlib', lambda obj: app.json.response(obj).get_data(), data, args.runs)
+        app.config['JSON_USE_ORJSON'] = True
+        fast = measure('app provider, orjson', lambda obj: app.json.response(obj).get_data(), data, args.runs)
+        print(f'  speedup vs flask default: stdlib {baseline / stdlib:.1f}x, orjson {baseline / fast:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
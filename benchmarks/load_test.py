@@ -0,0 +1,271 @@
+"""Load-test harness for the banking API.
+
+Seeds users (each with a few accounts and some transaction history), then runs
+virtual users that log in once and keep sending a weighted mix of requests:
+POST /login, GET /user_portal, GET /accounts, GET /transactions and
+POST /transactions. Reports req/s and p50/p95/p99 latency per route.
+
+By default the API is served in-process by a threaded Werkzeug server on a
+throwaway SQLite database, with the login rate limiter off. --database-uri points
+it at PostgreSQL instead, and --base-url drives an already running server (seeded
+against the same database). All virtual users log in from this host, so start
+that server with LOGIN_RATE_LIMIT_ENABLED off, or logins beyond the per-IP and
+per-username bursts are throttled (reported separately as 429s).
+
+    python benchmarks/load_test.py --users 200 --concurrency 32 --duration 30
+    python benchmarks/load_test.py --mix user_portal=5,accounts=3,transfer=1 --max-p95-ms 250
+
+Exits with status 1 when --max-p95-ms or --max-error-rate is exceeded, so it can
+guard against regressions in CI.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+PASSWORD = 'loadtest-pass'
+
+# Request kinds of the traffic mix: (method, path template, label)
+ROUTES = {
+    'login': ('POST', '/login', 'POST /login'),
+    'user_portal': ('GET', '/user_portal', 'GET /user_portal'),
+    'accounts': ('GET', '/accounts?limit=20', 'GET /accounts'),
+    'transactions': ('GET', '/transactions?limit=20', 'GET /transactions'),
+    'transfer': ('POST', '/transactions', 'POST /transactions')
+}
+DEFAULT_MIX = 'login=1,user_portal=4,accounts=3,transactions=3,transfer=1'
+
+
+def seed(app, users, accounts_per_user, transactions_per_user):
+    # Bulk insert the load-test users (all sharing one password hash) and their data.
+    # Returns the username and account numbers of every seeded user.
+    from werkzeug.security import generate_password_hash
+    from datetime import datetime
+    from iebank_api import db
+    from iebank_api.models import Account, Transaction, User
+
+    with app.app_context():
+        db.create_all()
+        password = generate_password_hash(PASSWORD, method='pbkdf2:sha256')
+        existing = {user.username: user for user in User.query.filter(User.username.like('load%')).all()}
+        seeded = []
+        for i in range(users):
+            username = f'load{i:06d}'
+            user = existing.get(username)
+            if user is None:
+                user = User(username=username, email=f'{username}@example.com', password=password,
+                            country='Spain', date_of_birth=datetime(1990, 1, 1))
+                db.session.add(user)
+                db.session.flush()
+                accounts = [Account(name=f'Account {j}', balance=100000, currency='USD', country='Spain', user_id=user.id)
+                            for j in range(accounts_per_user)]
+                db.session.add_all(accounts)
+                db.session.flush()
+                db.session.add_all(
+                    Transaction(from_account_id=accounts[j % len(accounts)].id,
+                                to_account_id=accounts[(j + 1) % len(accounts)].id, amount=1, currency='USD')
+                    for j in range(transactions_per_user)
+                )
+            else:
+                accounts = user.accounts
+            seeded.append((username, [account.account_number for account in accounts]))
+            if i % 100 == 99:
+                db.session.commit()
+        db.session.commit()
+    return seeded
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ROUTES:
+            raise SystemExit(f'unknown route in --mix: {name} (choose from {", ".join(ROUTES)})')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Client:
+    # One virtual user: a keep-alive connection, a token and the user's accounts
+
+    def __init__(self, base_url, username, account_numbers, all_account_numbers):
+        url = urllib.parse.urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.connection = None
+        self.username = username
+        self.account_numbers = account_numbers
+        self.all_account_numbers = all_account_numbers
+        self.token = None
+
+    def send(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['x-access-token'] = self.token
+        data = json.dumps(body).encode() if body is not None else None
+        for attempt in range(2):
+            try:
+                if self.connection is None:
+                    self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                self.connection.request(method, path, body=data, headers=headers)
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                # The server closed the keep-alive connection; reconnect once
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    return 0, b''
+
+    def login(self):
+        status, body = self.send('POST', '/login', {'username': self.username, 'password': PASSWORD})
+        if status == 200:
+            self.token = json.loads(body)['token']
+        return status
+
+    def call(self, kind):
+        if kind == 'login':
+            return self.login()
+        method, path, _ = ROUTES[kind]
+        body = None
+        if kind == 'transfer':
+            body = {
+                'from_account_number': random.choice(self.account_numbers),
+                'to_account_number': random.choice(self.all_account_numbers),
+                'amount': 1,
+                'currency': 'USD'
+            }
+        return self.send(method, path, body)[0]
+
+
+def run(base_url, seeded, mix, concurrency, duration):
+    kinds, weights = zip(*mix.items())
+    all_account_numbers = [number for _, numbers in seeded for number in numbers]
+    results = {kind: {'latencies': [], 'errors': 0, 'throttled': 0} for kind in kinds}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def virtual_user(index):
+        username, numbers = seeded[index % len(seeded)]
+        client = Client(base_url, username, numbers, all_account_numbers)
+        client.login()
+        while not stop.is_set():
+            kind = random.choices(kinds, weights)[0]
+            start = time.perf_counter()
+            status = client.call(kind)
+            elapsed = time.perf_counter() - start
+            with lock:
+                results[kind]['latencies'].append(elapsed)
+                if status != 200:
+                    results[kind]['errors'] += 1
+                if status == 429:
+                    results[kind]['throttled'] += 1
+
+    threads = [threading.Thread(target=virtual_user, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    report = {}
+    for kind, result in results.items():
+        latencies = result['latencies']
+        report[ROUTES[kind][2]] = {
+            'requests': len(latencies),
+            'errors': result['errors'],
+            'throttled': result['throttled'],
+            'req/s': len(latencies) / duration,
+            'p50 ms': percentile(latencies, 0.50) * 1000,
+            'p95 ms': percentile(latencies, 0.95) * 1000,
+            'p99 ms': percentile(latencies, 0.99) * 1000
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load.db')}")
+    parser.add_argument('--base-url', help='drive a running server instead of an in-process one')
+    parser.add_argument('--users', type=int, default=100, help='users to seed')
+    parser.add_argument('--accounts', type=int, default=3, help='accounts per user')
+    parser.add_argument('--transactions', type=int, default=20, help='seeded transactions per user')
+    parser.add_argument('--concurrency', type=int, default=16, help='virtual users')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'route weights (default {DEFAULT_MIX})')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--max-p95-ms', type=float, help='fail if any route has a higher p95')
+    parser.add_argument('--max-error-rate', type=float, help='fail if more than this fraction of requests fail')
+    args = parser.parse_args()
+
+    os.environ['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    os.environ.setdefault('SECRET_KEY', 'loadtest')
+    from werkzeug.serving import make_server
+    from iebank_api import create_app
+
+    app = create_app()
+    # Every virtual user logs in from this host, which the per-IP login limit would throttle
+    app.config['LOGIN_RATE_LIMIT_ENABLED'] = False
+    seeded = seed(app, args.users, args.accounts, args.transactions)
+    mix = parse_mix(args.mix)
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+    try:
+        report = run(base_url, seeded, mix, args.concurrency, args.duration)
+    finally:
+        if server:
+            server.shutdown()
+
+    total = sum(route['requests'] for route in report.values())
+    errors = sum(route['errors'] for route in report.values())
+    if args.json:
+        print(json.dumps({'routes': report, 'req/s': total / args.duration, 'errors': errors}, indent=2))
+    else:
+        print(f'== {args.concurrency} virtual users, {args.users} users seeded, {args.duration:.0f}s')
+        print(f"  {'route':<20} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for label, route in report.items():
+            print(f"  {label:<20} {route['requests']:>9} {route['errors']:>7} {route['req/s']:>8.1f} "
+                  f"{route['p50 ms']:>8.1f} {route['p95 ms']:>8.1f} {route['p99 ms']:>8.1f}")
+        print(f"  {'total':<20} {total:>9} {errors:>7} {total / args.duration:>8.1f}")
+
+    throttled = sum(route['throttled'] for route in report.values())
+    if throttled and not args.json:
+        print(f'WARNING: {throttled} requests were rate limited (429); run the server with the login rate limiter off')
+
+    failed = False
+    if args.max_p95_ms is not None:
+        for label, route in report.items():
+            if route['p95 ms'] > args.max_p95_ms:
+                print(f'FAIL: {label} p95 {route["p95 ms"]:.1f} ms > {args.max_p95_ms} ms')
+                failed = True
+    if args.max_error_rate is not None and total and errors / total > args.max_error_rate:
+        print(f'FAIL: error rate {errors / total:.3f} > {args.max_error_rate}')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
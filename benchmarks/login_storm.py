@@ -0,0 +1,135 @@
+"""Login storm benchmark.
+
+Serves the API with a threaded Werkzeug server on a throwaway SQLite database,
+floods /login from many client threads and meanwhile probes an unrelated route,
+once with password hashing on the request thread and once in the process pool.
+
+    python benchmarks/login_storm.py --clients 32 --duration 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import json
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+os.environ.setdefault('SECRET_KEY', 'bench')
+
+from werkzeug.serving import make_server  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+from datetime import datetime  # noqa: E402
+from iebank_api import create_app, db, hashing  # noqa: E402
+from iebank_api.models import User  # noqa: E402
+
+app = create_app()
+# Every client logs in as benchuser from this host: measure hashing, not the login rate limiter
+app.config['LOGIN_RATE_LIMIT_ENABLED'] = False
+
+
+def seed():
+    with app.app_context():
+        db.create_all()
+        if not User.query.filter_by(username='benchuser').first():
+            db.session.add(User(
+                username='benchuser',
+                email='benchuser@example.com',
+                password=generate_password_hash('benchpass', method='pbkdf2:sha256'),
+                country='Spain',
+                date_of_birth=datetime(1990, 1, 1)
+            ))
+            db.session.commit()
+
+
+def request(url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(base_url, clients, duration):
+    stop = threading.Event()
+    statuses = []
+    probe_latencies = []
+
+    def storm():
+        while not stop.is_set():
+            statuses.append(request(f'{base_url}/login', {'username': 'benchuser', 'password': 'benchpass'}))
+
+    def probe():
+        while not stop.is_set():
+            start = time.perf_counter()
+            request(f'{base_url}/')
+            probe_latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=storm) for _ in range(clients)] + [threading.Thread(target=probe)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    ok = statuses.count(200)
+    return {
+        'logins/s': ok / duration,
+        'rejected (503)': statuses.count(503),
+        'throttled (429)': statuses.count(429),
+        'other errors': len(statuses) - ok - statuses.count(503) - statuses.count(429),
+        'probe p50 ms': percentile(probe_latencies, 0.50) * 1000,
+        'probe p95 ms': percentile(probe_latencies, 0.95) * 1000,
+        'probe p99 ms': percentile(probe_latencies, 0.99) * 1000,
+        'probe max ms': max(probe_latencies) * 1000 if probe_latencies else float('nan'),
+        'probe mean ms': statistics.mean(probe_latencies) * 1000 if probe_latencies else float('nan'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=32, help='concurrent login clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per scenario')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='hashing pool size')
+    parser.add_argument('--queue-depth', type=int, default=32, help='hashing pool queue depth')
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    seed()
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    for label, workers in (('inline hashing', 0), (f'pool of {args.workers}', args.workers)):
+        app.config['PASSWORD_HASH_WORKERS'] = workers
+        app.config['PASSWORD_HASH_QUEUE_DEPTH'] = args.queue_depth
+        hashing.shutdown_pool()
+        results = run(base_url, args.clients, args.duration)
+        print(f'== {label} ({args.clients} clients, {args.duration:.0f}s)')
+        for key, value in results.items():
+            print(f'  {key:<16} {value:10.2f}')
+
+    hashing.shutdown_pool()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
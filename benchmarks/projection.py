@@ -0,0 +1,103 @@
+"""Column projection benchmark for the list endpoints.
+
+Seeds a throwaway SQLite database with users, then reads and formats all of them
+the way GET /admin_portal used to (ORM User instances) and the way it does now
+(Core rows of USER_COLUMNS), both as a keyset-paged walk and as one full load.
+Reports rows/s and the peak Python memory allocated while reading.
+
+    python benchmarks/projection.py --users 100000 --page-size 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'projection.db')}"
+os.environ.setdefault('SECRET_KEY', 'bench')
+
+from sqlalchemy import insert, select  # noqa: E402
+from iebank_api import create_app, db  # noqa: E402
+from iebank_api.models import User  # noqa: E402
+from iebank_api.pagination import keyset, split_page  # noqa: E402
+from iebank_api.routes import USER_COLUMNS, format_user  # noqa: E402
+
+
+def seed(count):
+    # Bulk insert users with a realistic (pbkdf2-sized) password hash
+    password = 'pbkdf2:sha256:600000$' + 'x' * 16 + '$' + 'f' * 64
+    start = datetime(2024, 1, 1)
+    rows = [{
+        'username': f'user{i:07d}', 'email': f'user{i:07d}@example.com', 'password': password,
+        'country': 'Spain', 'date_of_birth': datetime(1990, 1, 1), 'created_at': start + timedelta(seconds=i),
+        'updated_at': start, 'last_login_at': start, 'failed_login_attempts': 0, 'status': 'Active',
+        'role': 'user', 'token_version': 0
+    } for i in range(count)]
+    for i in range(0, count, 10000):
+        db.session.execute(insert(User), rows[i:i + 10000])
+    db.session.commit()
+
+
+def orm_page(limit, cursor):
+    return split_page(db.session.scalars(keyset(select(User), User, limit, cursor)).all(), limit)
+
+
+def projected_page(limit, cursor):
+    return split_page(db.session.execute(keyset(select(*USER_COLUMNS), User, limit, cursor)).all(), limit)
+
+
+def walk(read_page, limit):
+    # Format every user page by page, as a client following next_cursor would
+    count = 0
+    cursor = None
+    while True:
+        rows, next_cursor = read_page(limit, cursor)
+        count += len([format_user(row) for row in rows])
+        # Each request ends its session, dropping the page's instances
+        db.session.remove()
+        if not next_cursor:
+            return count
+        last = rows[-1]
+        cursor = (last.created_at, last.id)
+
+
+def measure(label, run):
+    db.session.remove()
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = run()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.remove()
+    print(f'  {label:<24} {count / elapsed:>10,.0f} rows/s  {elapsed * 1000:8.0f} ms  peak {peak / 2 ** 20:7.1f} MiB')
+    return count / elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(args.users)
+
+        print(f'== paged walk, {args.users} users, {args.page_size} per page')
+        orm, orm_peak = measure('orm instances', lambda: walk(orm_page, args.page_size))
+        rows, rows_peak = measure('projected rows', lambda: walk(projected_page, args.page_size))
+        print(f'  {rows / orm:.1f}x rows/s, {orm_peak / rows_peak:.1f}x less peak memory')
+
+        print(f'== full load, {args.users} users')
+        orm, orm_peak = measure('orm instances', lambda: walk(orm_page, args.users))
+        rows, rows_peak = measure('projected rows', lambda: walk(projected_page, args.users))
+        print(f'  {rows / orm:.1f}x rows/s, {orm_peak / rows_peak:.1f}x less peak memory')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""Query plan and latency benchmark for the hot query shapes.
+
+Seeds a large throwaway SQLite database, then drives GET /user_portal,
+GET /transactions and POST /transactions through the test client, first with the
+secondary indexes dropped and then with them created. For every statement a route
+runs it prints SQLite's EXPLAIN QUERY PLAN, followed by per-route latencies.
+
+    python benchmarks/query_plans.py --users 2000 --transactions 200000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+os.environ.setdefault('SECRET_KEY', 'bench')
+
+from sqlalchemy import event, insert  # noqa: E402
+from iebank_api import create_app, db  # noqa: E402
+from iebank_api.models import Account, Transaction, User  # noqa: E402
+from iebank_api.auth import encode_token  # noqa: E402
+
+app = create_app()
+
+INDEXED_TABLES = [Account.__table__, Transaction.__table__, User.__table__]
+
+
+def seed(users, accounts_per_user, transactions):
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    db.session.execute(insert(User), [{
+        'username': f'user{i}',
+        'email': f'user{i}@example.com',
+        'password': 'x',
+        'country': 'Spain',
+        'date_of_birth': datetime(1990, 1, 1),
+        'created_at': start + timedelta(seconds=i),
+        'role': 'user',
+        'status': 'Active',
+        'token_version': 0
+    } for i in range(users)])
+    user_ids = db.session.scalars(db.select(User.id).where(User.username.like('user%'))).all()
+
+    db.session.execute(insert(Account), [{
+        'name': f'Account {i}',
+        'account_number': f'{i:020d}',
+        'balance': 1_000_000.0,
+        'currency': 'EUR',
+        'country': 'Spain',
+        'status': 'Active',
+        'created_at': start + timedelta(seconds=i),
+        'user_id': user_id
+    } for i, user_id in enumerate(uid for uid in user_ids for _ in range(accounts_per_user))])
+    account_ids = db.session.scalars(db.select(Account.id)).all()
+
+    batch = []
+    for i in range(transactions):
+        from_id, to_id = rng.sample(account_ids, 2)
+        batch.append({
+            'from_account_id': from_id,
+            'to_account_id': to_id,
+            'amount': 1.0,
+            'currency': 'EUR',
+            'status': 'Completed',
+            'created_at': start + timedelta(seconds=i)
+        })
+        if len(batch) == 10_000:
+            db.session.execute(insert(Transaction), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Transaction), batch)
+    db.session.commit()
+    return user_ids
+
+
+def set_indexes(enabled):
+    with db.engine.begin() as conn:
+        for table in INDEXED_TABLES:
+            for index in table.indexes:
+                if enabled:
+                    index.create(conn, checkfirst=True)
+                else:
+                    index.drop(conn, checkfirst=True)
+        conn.exec_driver_sql('ANALYZE')
+
+
+def capture(client, method, path, **kwargs):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'INSERT')):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.open(path, method=method, **kwargs)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return statements
+
+
+def explain(statements):
+    with db.engine.connect() as conn:
+        for statement, parameters in statements:
+            print('   ', ' '.join(statement.split())[:110])
+            for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters):
+                print('       ', row[-1])
+
+
+def run_scenarios(client, tokens, numbers, iterations):
+    rng = random.Random(7)
+    scenarios = {
+        'GET /user_portal': lambda token, _: ('GET', '/user_portal', {}),
+        'GET /transactions': lambda token, _: ('GET', '/transactions', {}),
+        'POST /transactions': lambda token, from_number: ('POST', '/transactions', {'json': {
+            'from_account_number': from_number,
+            'to_account_number': rng.choice(numbers),
+            'amount': 1.0,
+            'currency': 'EUR'
+        }}),
+    }
+    results = {}
+    for name, build in scenarios.items():
+        user_index = rng.randrange(len(tokens))
+        method, path, kwargs = build(tokens[user_index], numbers[user_index])
+        print(f'  {name}')
+        explain(capture(client, method, path, headers={'x-access-token': tokens[user_index]}, **kwargs))
+
+        timings = []
+        for _ in range(iterations):
+            user_index = rng.randrange(len(tokens))
+            method, path, kwargs = build(tokens[user_index], numbers[user_index])
+            start = time.perf_counter()
+            response = client.open(path, method=method, headers={'x-access-token': tokens[user_index]}, **kwargs)
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200
+        results[name] = timings
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--accounts-per-user', type=int, default=3)
+    parser.add_argument('--transactions', type=int, default=200_000)
+    parser.add_argument('--iterations', type=int, default=50, help='requests timed per route')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        user_ids = seed(args.users, args.accounts_per_user, args.transactions)
+        print(f'Seeded {args.users} users and {args.transactions} transactions in {time.perf_counter() - started:.1f}s\n')
+
+        tokens = [encode_token(db.session.get(User, user_id)) for user_id in user_ids[:200]]
+        numbers = [db.session.execute(db.select(Account.account_number).where(Account.user_id == user_id).limit(1)).scalar()
+                   for user_id in user_ids[:200]]
+        client = app.test_client()
+
+        summary = {}
+        for label, enabled in (('without indexes', False), ('with indexes', True)):
+            set_indexes(enabled)
+            print(f'== {label}')
+            summary[label] = run_scenarios(client, tokens, numbers, args.iterations)
+            print()
+
+        print(f'{"route":<20}{"indexes":<18}{"p50 ms":>10}{"p95 ms":>10}{"mean ms":>10}')
+        for label, results in summary.items():
+            for name, timings in results.items():
+                timings = sorted(timings)
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                print(f'{name:<20}{label:<18}{statistics.median(timings) * 1000:>10.2f}'
+                      f'{p95 * 1000:>10.2f}{statistics.mean(timings) * 1000:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Cold startup benchmark.
+
+Starts a fresh interpreter per run and measures the time to import the package,
+build the app with create_app() and serve the first request, on a throwaway
+SQLite database that already has its schema.
+
+    python benchmarks/startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+PROBE = '''
+import json, time
+start = time.perf_counter()
+from iebank_api import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/')
+served = time.perf_counter()
+assert response.status_code == 200
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_request': served - created,
+    'total': served - start
+}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}"
+    env.setdefault('SECRET_KEY', 'bench')
+    env['PYTHONPATH'] = ROOT
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app.py', 'init-db'], cwd=ROOT, env=env,
+                   check=True, capture_output=True)
+
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f'{"phase":<16}{"median ms":>12}{"max ms":>12}')
+    for phase in ('import', 'create_app', 'first_request', 'total'):
+        values = [sample[phase] * 1000 for sample in samples]
+        print(f'{phase:<16}{statistics.median(values):>12.1f}{max(values):>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,99 @@
 import os
 
+
+def pooled_engine_options(pool_size, max_overflow, pool_recycle=1800, pool_timeout=10):
+    # Connection pool settings for PostgreSQL, overridable per deployment through env vars
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', pool_size)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', max_overflow)),
+        # Recycle before Azure's idle connection timeout and test connections on checkout,
+        # so connections dropped while idle are replaced instead of failing a request
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', pool_recycle)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', pool_timeout)),
+        'pool_pre_ping': True,
+        'connect_args': {'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5))}
+    }
+
+
 class Config(object):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     DEBUG = False
+    # How often each process re-reads the token versions of the users it has seen
+    TOKEN_VERSION_REFRESH_SECONDS = 30
+    # How many users' token versions each process keeps (least recently seen evicted
+    # first) and how many ids go in each IN query that re-reads them
+    TOKEN_VERSION_MAX_USERS = 10000
+    TOKEN_VERSION_QUERY_CHUNK = 500
+    # Size of the password hashing process pool (0 hashes on the request thread)
+    # and how many extra hashing requests may wait before /login answers 503
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_QUEUE_DEPTH = 32
+    # /login token buckets per client IP and per username, as (burst, refills per minute);
+    # attempts over them get a 429 before any password is hashed. The buckets live in
+    # LOGIN_RATE_LIMIT_STORAGE: 'memory' (per process) or 'sqlite:///<path>' (shared by
+    # the workers of a host)
+    LOGIN_RATE_LIMIT_ENABLED = True
+    LOGIN_RATE_LIMIT_STORAGE = os.environ.get('LOGIN_RATE_LIMIT_STORAGE', 'memory')
+    LOGIN_RATE_LIMITS = {'ip': (30, 60), 'username': (5, 5)}
+    # Failed logins in a row that lock an account, and for how long
+    MAX_FAILED_LOGIN_ATTEMPTS = 5
+    LOGIN_LOCKOUT_SECONDS = 15 * 60
+    # Reverse proxies in front of the app whose X-Forwarded-For is trusted for client IPs.
+    # While it is 0, logins that carry X-Forwarded-For are only rate limited per username.
+    PROXY_COUNT = int(os.environ.get('PROXY_COUNT', 0))
+    # Encode JSON responses with orjson when it is installed (the stdlib otherwise)
+    JSON_USE_ORJSON = True
+    # Compress response bodies of at least COMPRESSION_MIN_SIZE bytes with brotli (when
+    # installed) or gzip, whichever the client prefers. Levels trade CPU per request for
+    # bytes: gzip 1-9, brotli 0-11. Turn off when a proxy in front already compresses.
+    COMPRESSION_ENABLED = True
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSION_LEVEL = 6
+    COMPRESSION_BROTLI_QUALITY = 4
+    # Number of recent transactions shown on /user_portal
+    PORTAL_RECENT_TRANSACTIONS = 10
+    # How long the outcome of a POST sent with an Idempotency-Key is replayed to its
+    # retries; `flask purge-idempotency-keys` deletes older keys
+    IDEMPOTENCY_KEY_TTL_SECONDS = 24 * 60 * 60
+    # Largest number of transfers accepted by POST /transactions/batch
+    TRANSACTION_BATCH_MAX_SIZE = 5000
+    # How long each process keeps its currency conversion matrix before re-reading exchange rates
+    FX_RATES_TTL_SECONDS = 60
+    # Telemetry buffer size (records beyond it are dropped) and per-endpoint sampling
+    # of successful requests; failed requests are always recorded
+    TELEMETRY_QUEUE_SIZE = 10000
+    TELEMETRY_DEFAULT_SAMPLE_RATE = 1.0
+    TELEMETRY_SAMPLE_RATES = {
+        'api.get_transactions': 0.1,
+        'api.get_accounts': 0.1,
+        'api.user_portal': 0.1
+    }
+    # Directory shared by all workers of a server where each writes its request metrics
+    # (at most every METRICS_FLUSH_SECONDS) so /metrics can aggregate them; unset keeps
+    # metrics per process
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_SECONDS = 5
+    # Bearer token required to scrape /metrics (open when unset)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Statements slower than this are logged with their route
+    SLOW_QUERY_THRESHOLD_MS = 200
+    # Report each request's statement count and database time in X-DB-* response headers
+    QUERY_STATS_HEADERS = True
+    # Most statements a request to each endpoint should run; going over is logged, or
+    # raised when QUERY_BUDGET_ENFORCE is set (the test suite does)
+    QUERY_BUDGETS = {
+        'api.login': 2,
+        'api.user_portal': 5,
+        'api.admin_portal': 3,
+        'api.get_accounts': 3,
+        'api.get_transactions': 3,
+        'api.create_transaction': 14
+    }
+    QUERY_BUDGET_ENFORCE = False
 
 class LocalConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///local.db'
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
     DEBUG = True
 
 class GithubCIConfig(Config):
@@ -19,6 +107,9 @@ class DevelopmentConfig(Config):
     dbhost=os.getenv('DBHOST'),
     dbname=os.getenv('DBNAME')
     )
+    SQLALCHEMY_ENGINE_OPTIONS = pooled_engine_options(pool_size=5, max_overflow=5)
+    # App Service's front end is the one proxy in front of the deployed app
+    PROXY_COUNT = int(os.environ.get('PROXY_COUNT', 1))
     DEBUG = True
 
 class UATConfig(Config):
@@ -28,5 +119,12 @@ class UATConfig(Config):
     dbhost=os.getenv('DBHOST'),
     dbname=os.getenv('DBNAME')
     )
+    SQLALCHEMY_ENGINE_OPTIONS = pooled_engine_options(pool_size=10, max_overflow=10)
+    # App Service's front end is the one proxy in front of the deployed app
+    PROXY_COUNT = int(os.environ.get('PROXY_COUNT', 1))
     DEBUG = False
+
+class ProductionConfig(UATConfig):
+    QUERY_STATS_HEADERS = False
+    SQLALCHEMY_ENGINE_OPTIONS = pooled_engine_options(pool_size=20, max_overflow=20, pool_timeout=5)
     
@@ -0,0 +1,55 @@
+# Production serving settings, picked up by gunicorn from the working directory:
+#   gunicorn app:app
+import os
+import tempfile
+
+# Workers share a metrics directory so /metrics reports the whole server
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='iebank-metrics-'))
+# and a login rate limit store so the limits hold across workers
+os.environ.setdefault('LOGIN_RATE_LIMIT_STORAGE',
+                      f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='iebank-ratelimit-'), 'login.db')}")
+
+from iebank_api.serving import cpu_count  # noqa: E402
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# One process per core, each with a few threads to overlap requests waiting on the database
+workers = int(os.environ.get('WEB_CONCURRENCY', cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+# Recycle workers now and then (with jitter so they do not restart together) to bound
+# memory growth, and give in-flight requests time to finish on restarts and shutdown
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+
+def on_starting(server):
+    # Drop snapshots left by the workers of a previous run
+    directory = os.environ['METRICS_DIR']
+    for name in os.listdir(directory):
+        if name.startswith('metrics-'):
+            os.remove(os.path.join(directory, name))
+
+
+def post_fork(server, worker):
+    from iebank_api.serving import init_worker
+    init_worker(worker.app.wsgi())
+
+
+def worker_exit(server, worker):
+    # Write the requests served since the last flush before the worker goes away
+    from iebank_api.metrics import registry
+    registry.flush(os.environ['METRICS_DIR'])
+
+
+def child_exit(server, worker):
+    # Merge the exited worker's metrics into the archive so dead workers' files do not pile up
+    from iebank_api.metrics import archive_worker
+    archive_worker(os.environ['METRICS_DIR'], worker.pid)
@@ -2,90 +2,86 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
-from opencensus.ext.azure.log_exporter import AzureLogHandler
-import logging
-from datetime import timedelta, datetime
-from werkzeug.security import generate_password_hash
-
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///local.db')
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
-app.permanent_session_lifetime = timedelta(days=1)
-
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-
-# Configure CORS
-CORS(app, supports_credentials=True)
-
-# Select environment based on the ENV environment variable
-env = os.getenv('ENV')
-if env == 'local':
-    app.config.from_object('config.LocalConfig')
-elif env == 'development':
-    app.config.from_object('config.DevelopmentConfig')
-elif env == 'uat':
-    app.config.from_object('config.UATConfig')
-elif env == 'ghci':
-    app.config.from_object('config.GithubCIConfig')
-elif env == 'prod':
-    app.config.from_object('config.ProductionConfig')
-
-# Configure Azure Application Insights
-app.config['APPINSIGHTS_CONNECTION_STRING'] = os.environ.get('APPINSIGHTS_CONNECTION_STRING')
-
-if app.config['APPINSIGHTS_CONNECTION_STRING']:
-    handler = AzureLogHandler(connection_string=app.config['APPINSIGHTS_CONNECTION_STRING'])
-    logger = logging.getLogger(__name__)
-    logger.addHandler(handler)
-    logger.setLevel(logging.INFO)
-    app.logger.addHandler(handler)
-
-from iebank_api.models import Account, User, Transaction
-
-
-def create_admin_user():
+from datetime import timedelta
+from iebank_api.pool_metrics import InstrumentedQueuePool, instrument_pool
+from iebank_api.telemetry import start_telemetry
+from iebank_api.metrics import instrument_queries
+from iebank_api.json_provider import FastJSONProvider
+from iebank_api.compression import compress_response
+
+db = SQLAlchemy()
+migrate = Migrate()
+
+# Configuration class for each value of the ENV environment variable
+ENV_CONFIGS = {
+    'local': 'config.LocalConfig',
+    'development': 'config.DevelopmentConfig',
+    'uat': 'config.UATConfig',
+    'ghci': 'config.GithubCIConfig',
+    'prod': 'config.ProductionConfig'
+}
+
+
+def start_app_insights(app):
+    from opencensus.ext.azure.log_exporter import AzureLogHandler
+    start_telemetry(app, AzureLogHandler(connection_string=app.config['APPINSIGHTS_CONNECTION_STRING']))
+
+
+def create_app(config=None):
+    # Build the app without touching the database: schema creation and admin seeding
+    # are the `flask init-db` and `flask seed-admin` commands
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///local.db')
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+    app.permanent_session_lifetime = timedelta(days=1)
+
+    # Select environment based on the ENV environment variable
+    app.config.from_object(ENV_CONFIGS.get(os.getenv('ENV'), 'config.Config'))
+    if isinstance(config, dict):
+        app.config.from_mapping(config)
+    elif config is not None:
+        app.config.from_object(config)
+
+    # Size pooled connections with the instrumented pool so checkout waits are measured
+    engine_options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    if 'pool_size' in engine_options:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(engine_options, poolclass=InstrumentedQueuePool)
+
+    db.init_app(app)
+    migrate.init_app(app, db)
     with app.app_context():
-        # Define the admin user details
-        username = 'adminuser'
-        email = 'adminuser@example.com'
-        password = 'adminpassword123'
-        country = 'USA'
-        date_of_birth = '2004-06-29'
-        role = 'admin'
-        status = 'active'
-
-        # Hash the password
-        hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
-
-        # Convert date_of_birth to a datetime object
-        date_of_birth = datetime.strptime(date_of_birth, '%Y-%m-%d')
-
-        # Create the new admin user
-        new_user = User(
-            username=username,
-            email=email,
-            password=hashed_password,
-            country=country,
-            date_of_birth=date_of_birth,
-            role=role,
-            status=status
-        )
-
-        # Add the new user to the database
-        # if the new user does not already exist
-        if User.query.filter_by(username=username).first():
-            print(f"Admin user '{username}' already exists.")
-            return
-        
-        db.session.add(new_user)
-        db.session.commit()
-
-        print(f"Admin user '{username}' created successfully.")
-
-with app.app_context():
-    db.create_all()
-    create_admin_user()
-
-from iebank_api import routes
+        instrument_pool(db.engine, 'sync')
+        instrument_queries(db.engine)
+
+    # Behind reverse proxies, read the client address from X-Forwarded-For
+    if app.config.get('PROXY_COUNT'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_COUNT'])
+
+    # Configure CORS
+    CORS(app, supports_credentials=True)
+
+    # Compress large responses for clients that accept it
+    app.after_request(compress_response)
+
+    # Configure Azure Application Insights, importing the exporter only when it is used.
+    # Records reach it through a bounded queue so exporting never runs on a request thread.
+    app.config['APPINSIGHTS_CONNECTION_STRING'] = os.environ.get('APPINSIGHTS_CONNECTION_STRING')
+
+    if app.config['APPINSIGHTS_CONNECTION_STRING']:
+        start_app_insights(app)
+
+    from iebank_api import models, summaries  # noqa: F401
+    from iebank_api.routes import api
+    from iebank_api.commands import (init_db_command, purge_idempotency_keys_command, rebuild_summaries_command,
+                                     seed_admin_command, upgrade_db_command)
+    app.register_blueprint(api)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(seed_admin_command)
+    app.cli.add_command(rebuild_summaries_command)
+    app.cli.add_command(purge_idempotency_keys_command)
+
+    return app
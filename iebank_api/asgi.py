@@ -0,0 +1,185 @@
+from flask import jsonify, request
+from iebank_api import db
+from iebank_api.auth import TokenError, authorize, decode_token, token_versions
+from iebank_api.conditional import make_etag, not_modified, tag, version_query
+from iebank_api.metrics import instrument_queries
+from iebank_api.models import Account, User, Transaction
+from iebank_api.pagination import keyset, page_args, split_page
+from iebank_api.pool_metrics import instrument_pool
+from iebank_api.routes import (format_account, format_portal, format_transaction, portal_user, recent_transactions,
+                               user_accounts, user_balances, user_transactions)
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+import io
+import sys
+
+# Async driver used for each database the app runs on
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg'
+}
+
+# Paths whose GET requests are served on the async engine; everything else goes to Flask
+ASYNC_PATHS = {'/accounts', '/transactions', '/user_portal'}
+
+
+def async_engine_args(app):
+    # Async counterpart of the Flask-SQLAlchemy engine: same database and pool sizing
+    with app.app_context():
+        url = db.engine.url
+    url = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    options.pop('poolclass', None)
+    connect_args = options.pop('connect_args', {})
+    if 'connect_timeout' in connect_args and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'timeout': connect_args['connect_timeout']}
+    return url, options
+
+
+def build_environ(scope):
+    # WSGI environ of an ASGI HTTP request without a body, so Flask can build the request
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def token_version(session, user_id):
+    # TokenVersionMap.get without blocking the event loop on its queries
+    if token_versions.stale():
+        for chunk in token_versions.chunks(token_versions.tracked()):
+            token_versions.merge(chunk, (await session.execute(token_versions.versions_query(chunk))).all())
+    found, version = token_versions.lookup(user_id)
+    if found:
+        return version
+    version = await session.scalar(select(User.token_version).where(User.id == user_id))
+    return token_versions.remember(user_id, version)
+
+
+async def get_accounts(session, current_user):
+    limit, cursor = page_args()
+    statement = keyset(user_accounts(current_user.id), Account, limit, cursor)
+    accounts, next_cursor = split_page((await session.execute(statement)).all(), limit)
+    return {'accounts': [format_account(account) for account in accounts], 'next_cursor': next_cursor}
+
+
+async def get_transactions(session, current_user):
+    limit, cursor = page_args()
+    statement = keyset(user_transactions(current_user.id), Transaction, limit, cursor)
+    transactions, next_cursor = split_page((await session.scalars(statement)).all(), limit)
+    return {'transactions': [format_transaction(transaction) for transaction in transactions], 'next_cursor': next_cursor}
+
+
+async def user_portal(session, current_user):
+    user, summary = (await session.execute(portal_user(current_user.id))).one()
+    balances = (await session.scalars(user_balances(current_user.id))).all()
+    transactions = (await session.scalars(recent_transactions(current_user.id))).all()
+    return format_portal(user, summary, balances, transactions)
+
+
+# Async implementations of the Flask views, by endpoint
+ASYNC_VIEWS = {
+    'api.get_accounts': get_accounts,
+    'api.get_transactions': get_transactions,
+    'api.user_portal': user_portal
+}
+
+
+class AsyncAPI:
+    # ASGI application serving the read-heavy endpoints with async SQLAlchemy, so a
+    # worker keeps handling requests while their queries wait on the database. Each
+    # request still runs inside a Flask request context, so request hooks (timing,
+    # metrics, CORS), JSON encoding and error handling match the sync views. Other
+    # requests are passed to the Flask app, which runs them on a thread pool.
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+        url, options = async_engine_args(app)
+        self.engine = create_async_engine(url, **options)
+        instrument_pool(self.engine.sync_engine, 'async')
+        instrument_queries(self.engine.sync_engine)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http' or scope['method'] != 'GET' or scope['path'] not in ASYNC_PATHS:
+            return await self.wsgi(scope, receive, send)
+
+        with self.app.request_context(build_environ(scope)):
+            response = await self.dispatch()
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers.items()]
+            })
+            await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def dispatch(self):
+        # Async version of Flask.full_dispatch_request for the views in ASYNC_VIEWS
+        app = self.app
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = await self.call_view(ASYNC_VIEWS[request.endpoint])
+        except Exception as e:
+            try:
+                rv = app.handle_user_exception(e)
+            except Exception as e:
+                rv = app.handle_exception(e)
+        return app.process_response(app.make_response(rv))
+
+    async def call_view(self, view):
+        async with self.sessionmaker() as session:
+            # Same checks and messages as token_required
+            token = request.headers.get('x-access-token')
+            if not token:
+                return jsonify({'message': 'Token is missing!'}), 401
+            try:
+                claims = decode_token(token)
+                current_user = authorize(claims, await token_version(session, claims['user_id']))
+            except TokenError as e:
+                return jsonify({'message': str(e)}), 401
+            except Exception as e:
+                print(f"Error decoding token: {e}")
+                return jsonify({'message': 'An error occurred during token validation.'}), 401
+
+            # Same conditional GET handling as the conditional decorator
+            etag = make_etag(current_user.id, await session.scalar(version_query(current_user.id)))
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            return tag(self.app.make_response(await view(session, current_user)), etag)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
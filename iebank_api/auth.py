@@ -0,0 +1,145 @@
+from flask import current_app
+from iebank_api import db
+from iebank_api.models import User
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+import threading
+import time
+import jwt
+
+# Identity of the caller as carried by the token claims
+TokenUser = namedtuple('TokenUser', ['id', 'role', 'status'])
+
+
+class TokenError(Exception):
+    # Raised when a token cannot be accepted; the message is safe to return to the client
+    pass
+
+
+def encode_token(user):
+    # Generate a JWT carrying everything token_required needs to authorize a request
+    return jwt.encode({
+        'user_id': user.id,
+        'role': user.role,
+        'status': user.status,
+        'ver': user.token_version,
+        'exp': datetime.utcnow() + timedelta(hours=24)
+    }, current_app.config['SECRET_KEY'], algorithm='HS256')
+
+
+def decode_token(token):
+    # Verify a token's signature and expiry and return its claims
+    try:
+        return jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        raise TokenError('Token has expired!')
+    except jwt.InvalidTokenError:
+        raise TokenError('Token is invalid!')
+
+
+def authorize(claims, version):
+    # Caller identity from token claims, given the user's current token version
+    if version is None:
+        raise TokenError('User not found!')
+    if claims['ver'] != version:
+        raise TokenError('Token has been revoked!')
+    return TokenUser(id=claims['user_id'], role=claims['role'], status=claims['status'])
+
+
+class TokenVersionMap:
+    # Process-local map of user id -> current token version.
+    # Only users that presented a token to this process are tracked, and they are
+    # re-read with a few IN queries every refresh interval, so changes made by other
+    # workers are picked up without a query per request. At most TOKEN_VERSION_MAX_USERS
+    # are kept, least recently seen evicted first; an evicted user is read directly
+    # again on their next request.
+
+    def __init__(self):
+        self._versions = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshed_at = time.monotonic()
+
+    def get(self, user_id):
+        # Current token version of a user, or None if the user no longer exists
+        if self.stale():
+            self.refresh()
+        found, version = self.lookup(user_id)
+        if found:
+            return version
+        version = db.session.execute(db.select(User.token_version).where(User.id == user_id)).scalar()
+        return self.remember(user_id, version)
+
+    def stale(self):
+        return time.monotonic() - self._refreshed_at > current_app.config.get('TOKEN_VERSION_REFRESH_SECONDS', 30)
+
+    def tracked(self):
+        # Ids to re-read, restarting the refresh interval
+        with self._lock:
+            self._refreshed_at = time.monotonic()
+            return list(self._versions)
+
+    @staticmethod
+    def chunks(user_ids):
+        # Ids split into IN lists short enough for every backend's bound parameter limit
+        # (SQLite allows 32766 per statement)
+        size = current_app.config.get('TOKEN_VERSION_QUERY_CHUNK', 500)
+        for start in range(0, len(user_ids), size):
+            yield user_ids[start:start + size]
+
+    @staticmethod
+    def versions_query(user_ids):
+        return db.select(User.id, User.token_version).where(User.id.in_(user_ids))
+
+    def merge(self, user_ids, rows):
+        # Apply re-read (id, token_version) rows; ids without a row no longer exist
+        versions = dict.fromkeys(user_ids)
+        versions.update((row.id, row.token_version) for row in rows)
+        with self._lock:
+            for user_id, version in versions.items():
+                # Users evicted since tracked() stay evicted; versions only grow, so
+                # never step back past a change this process just made
+                if user_id not in self._versions:
+                    continue
+                current = self._versions[user_id]
+                if version is None or current is None or version > current:
+                    self._versions[user_id] = version
+
+    def lookup(self, user_id):
+        with self._lock:
+            if user_id in self._versions:
+                self._versions.move_to_end(user_id)
+                return True, self._versions[user_id]
+        return False, None
+
+    def remember(self, user_id, version):
+        # Track a version read from the database, unless a newer one was recorded meanwhile
+        with self._lock:
+            version = self._versions.setdefault(user_id, version)
+            self._evict()
+            return version
+
+    def refresh(self):
+        user_ids = self.tracked()
+        for chunk in self.chunks(user_ids):
+            self.merge(chunk, db.session.execute(self.versions_query(chunk)).all())
+
+    def set(self, user_id, version):
+        # Record a version change made by this process
+        with self._lock:
+            self._versions[user_id] = version
+            self._versions.move_to_end(user_id)
+            self._evict()
+
+    def _evict(self):
+        # Drop the least recently seen users over the limit; called with the lock held
+        limit = current_app.config.get('TOKEN_VERSION_MAX_USERS', 10000)
+        while len(self._versions) > limit:
+            self._versions.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+            self._refreshed_at = time.monotonic()
+
+
+token_versions = TokenVersionMap()
@@ -0,0 +1,118 @@
+from iebank_api import db
+from iebank_api.models import User
+from iebank_api import summaries
+from iebank_api.idempotency import purge_expired
+from werkzeug.security import generate_password_hash
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from flask_migrate import stamp, upgrade
+from sqlalchemy import inspect
+
+
+def create_admin_user():
+    # Define the admin user details
+    username = 'adminuser'
+    email = 'adminuser@example.com'
+    password = 'adminpassword123'
+    country = 'USA'
+    date_of_birth = '2004-06-29'
+    role = 'admin'
+    status = 'active'
+
+    # Add the new user to the database
+    # if the new user does not already exist
+    if User.query.filter_by(username=username).first():
+        print(f"Admin user '{username}' already exists.")
+        return
+
+    # Hash the password
+    hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+
+    # Convert date_of_birth to a datetime object
+    date_of_birth = datetime.strptime(date_of_birth, '%Y-%m-%d')
+
+    # Create the new admin user
+    new_user = User(
+        username=username,
+        email=email,
+        password=hashed_password,
+        country=country,
+        date_of_birth=date_of_birth,
+        role=role,
+        status=status
+    )
+
+    db.session.add(new_user)
+    db.session.commit()
+
+    print(f"Admin user '{username}' created successfully.")
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    # Create missing tables and the default admin user. create_all never alters existing
+    # tables, so this is only for throwaway local databases; deployments use upgrade-db
+    db.create_all()
+    create_admin_user()
+
+
+# Migration matching the schema create_all built before deployments ran migrations
+BASELINE_REVISION = 'c46e6dc8d1ce'
+
+
+def baseline_schema(inspector):
+    # Whether the database holds the original user, account and transaction tables
+    # without any of the columns the later migrations add
+    if not {'user', 'account', 'transaction'} <= set(inspector.get_table_names()):
+        return False
+    return 'token_version' not in {column['name'] for column in inspector.get_columns('user')}
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    # Bring the schema to the latest migration, then create the default admin user.
+    # The migrations start from the original schema rather than an empty database, so
+    # a brand new database is created from the models and stamped as up to date.
+    inspector = inspect(db.engine)
+    tables = inspector.get_table_names()
+    if 'alembic_version' in tables:
+        upgrade()
+    elif baseline_schema(inspector):
+        # Built by create_all before deployments ran migrations: record it as the
+        # baseline (unless it predates even that) and migrate it from there
+        if 'currency' in {column['name'] for column in inspector.get_columns('transaction')}:
+            stamp(revision=BASELINE_REVISION)
+        upgrade()
+    elif 'user' in tables:
+        raise click.ClickException('The database has tables but no migration history; '
+                                   'run `flask db stamp <revision>` for its schema, then upgrade-db')
+    else:
+        db.create_all()
+        stamp()
+    create_admin_user()
+
+
+@click.command('seed-admin')
+@with_appcontext
+def seed_admin_command():
+    # Create the default admin user if it does not exist
+    create_admin_user()
+
+
+@click.command('rebuild-summaries')
+@with_appcontext
+def rebuild_summaries_command():
+    # Recompute every user portal summary from the accounts and transactions
+    with db.engine.begin() as connection:
+        summaries.rebuild(connection)
+    print('User summaries rebuilt.')
+
+
+@click.command('purge-idempotency-keys')
+@with_appcontext
+def purge_idempotency_keys_command():
+    # Delete idempotency keys older than IDEMPOTENCY_KEY_TTL_SECONDS (run it periodically)
+    print(f'{purge_expired()} expired idempotency keys deleted.')
@@ -0,0 +1,123 @@
+from flask import current_app, request
+from iebank_api.metrics import registry
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip is offered instead
+    brotli = None
+
+# Response types worth compressing; everything else (images, archives) is sent as is
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'}
+
+
+class Encoder:
+    # Incremental encoder for one response body. flush() ends a block the client can
+    # decode right away, so a streamed response still arrives chunk by chunk.
+
+    def __init__(self, coding, level):
+        self.coding = coding
+        if coding == 'br':
+            self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=level)
+        else:
+            # wbits 31: zlib stream with a gzip header and trailer
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.coding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        if self.coding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.coding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def codings():
+    # Content codings this server can produce, preferred first
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate():
+    # Best content coding accepted by the client, or None to send the body as is
+    return request.accept_encodings.best_match(codings())
+
+
+def encoder(coding):
+    if coding == 'br':
+        return Encoder(coding, current_app.config.get('COMPRESSION_BROTLI_QUALITY', 4))
+    return Encoder(coding, current_app.config.get('COMPRESSION_LEVEL', 6))
+
+
+def compressible(response):
+    return (
+        current_app.config.get('COMPRESSION_ENABLED', True)
+        and request.method != 'HEAD'
+        and 200 <= response.status_code < 300 and response.status_code != 204
+        and not response.direct_passthrough
+        and 'Content-Encoding' not in response.headers
+        and response.mimetype in COMPRESSIBLE_MIMETYPES
+    )
+
+
+def compress_response(response):
+    # after_request hook. Buffered bodies under COMPRESSION_MIN_SIZE are sent as is,
+    # the rest are compressed in one go; streamed bodies are compressed chunk by chunk
+    # as they are generated instead of being buffered.
+    if not compressible(response):
+        return response
+    # Whether or not this response is compressed, the same URL may be for other clients
+    response.vary.add('Accept-Encoding')
+    if not response.is_streamed and len(response.get_data()) < current_app.config.get('COMPRESSION_MIN_SIZE', 1024):
+        return response
+    coding = negotiate()
+    if coding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = stream(response.response, encoder(coding))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        body = encoder(coding)
+        compressed = body.compress(data) + body.finish()
+        response.set_data(compressed)
+        count_bytes(coding, len(data), len(compressed))
+
+    response.headers['Content-Encoding'] = coding
+    # A strong ETag names one exact body, so the compressed one gets its own
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{coding}')
+    return response
+
+
+def stream(chunks, body):
+    # Compress a streamed body without holding more than one chunk of it
+    sent = received = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            received += len(chunk)
+            data = body.compress(chunk) + body.flush()
+            sent += len(data)
+            yield data
+        data = body.finish()
+        sent += len(data)
+        yield data
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        count_bytes(body.coding, received, sent)
+
+
+def count_bytes(coding, size, compressed_size):
+    registry.inc('http_response_bytes_total', {'encoding': coding}, size)
+    registry.inc('http_response_compressed_bytes_total', {'encoding': coding}, compressed_size)
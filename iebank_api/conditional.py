@@ -0,0 +1,54 @@
+from flask import current_app, request
+from iebank_api import db
+from iebank_api.compression import codings
+from iebank_api.models import UserSummary
+from sqlalchemy import select
+from functools import wraps
+import hashlib
+
+
+def version_query(user_id):
+    return select(UserSummary.data_version).where(UserSummary.user_id == user_id)
+
+
+def make_etag(user_id, version):
+    # Strong validator of a response to the current request: the user's data version
+    # plus the path and query string, since every page of a list has its own body
+    digest = hashlib.blake2b(request.full_path.encode(), digest_size=8).hexdigest()
+    return f'{user_id}-{version or 0}-{digest}'
+
+
+def not_modified(etag):
+    # 304 response when the client already holds this representation (or a compressed
+    # one, whose ETag compress_response suffixed with the coding), else None
+    for candidate in [etag] + [f'{etag}-{coding}' for coding in codings()]:
+        if request.if_none_match.contains_weak(candidate):
+            response = current_app.response_class(status=304)
+            response.vary.add('Accept-Encoding')
+            return tag(response, candidate)
+    return None
+
+
+def tag(response, etag):
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+        # Per user, and always revalidated so changes are seen on the next poll
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('x-access-token')
+    return response
+
+
+def conditional(f):
+    # Answer If-None-Match with a 304 from a single primary key lookup, before the
+    # view runs any of its queries. The version is read before the view's data, so
+    # a change committed in between only makes the ETag older than the body, and
+    # the next request gets a fresh 200 instead of a stale 304.
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        etag = make_etag(current_user.id, db.session.scalar(version_query(current_user.id)))
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        return tag(current_app.make_response(f(current_user, *args, **kwargs)), etag)
+
+    return decorated
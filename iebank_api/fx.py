@@ -0,0 +1,73 @@
+from flask import current_app
+from iebank_api import db
+from iebank_api.models import ExchangeRate
+from collections import deque
+import threading
+import time
+
+# Used for pairs that have no row in the exchange_rate table
+DEFAULT_EXCHANGE_RATES = [('USD', 'EUR', 0.95)]
+
+
+def build_conversion_matrix(rates):
+    # Expand (base, quote, rate) triples into a {(from, to): factor} map covering every
+    # pair reachable through direct, inverse or chained rates
+    graph = {}
+    for base, quote, rate in rates:
+        graph.setdefault(base, {})[quote] = rate
+        graph.setdefault(quote, {}).setdefault(base, 1 / rate)
+
+    matrix = {}
+    for source in graph:
+        factors = {source: 1.0}
+        queue = deque([source])
+        while queue:
+            currency = queue.popleft()
+            for target, rate in graph[currency].items():
+                if target not in factors:
+                    factors[target] = factors[currency] * rate
+                    queue.append(target)
+        matrix.update(((source, target), factor) for target, factor in factors.items())
+    return matrix
+
+
+class ConversionCache:
+    # Process-local conversion matrix rebuilt from the exchange_rate table once its TTL
+    # expires. Lookups are a single dict access; a refresh builds a new matrix and swaps
+    # it in, so readers never see a half-built one and only one thread queries at a time.
+
+    def __init__(self):
+        self._matrix = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def rate(self, from_currency, to_currency):
+        # Factor converting from_currency into to_currency, or None if there is no path
+        matrix = self._matrix
+        if matrix is None or time.monotonic() - self._loaded_at > current_app.config.get('FX_RATES_TTL_SECONDS', 60):
+            matrix = self.refresh(blocking=matrix is None)
+        return matrix.get((from_currency, to_currency))
+
+    def refresh(self, blocking=True):
+        if not self._lock.acquire(blocking=blocking):
+            # Another thread is already refreshing, keep serving the current matrix
+            return self._matrix
+        try:
+            rows = db.session.execute(
+                db.select(ExchangeRate.base_currency, ExchangeRate.quote_currency, ExchangeRate.rate)
+            ).all()
+            stored = {(row.base_currency, row.quote_currency) for row in rows}
+            defaults = [rate for rate in DEFAULT_EXCHANGE_RATES
+                        if (rate[0], rate[1]) not in stored and (rate[1], rate[0]) not in stored]
+            self._matrix = build_conversion_matrix(defaults + [tuple(row) for row in rows])
+            self._loaded_at = time.monotonic()
+            return self._matrix
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+        self._matrix = None
+
+
+exchange_rates = ConversionCache()
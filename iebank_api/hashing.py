@@ -0,0 +1,60 @@
+from flask import abort, current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+from concurrent.futures import ProcessPoolExecutor
+import threading
+import os
+
+# pbkdf2 hashing runs in a dedicated process pool so a burst of logins cannot
+# hold the request threads (and the GIL) that every other route needs
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+_pool_pid = None
+
+
+def _get_pool():
+    # The pool is created on first use so each (forked) server worker gets its own
+    global _pool, _slots, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            workers = current_app.config.get('PASSWORD_HASH_WORKERS', 2)
+            queue_depth = current_app.config.get('PASSWORD_HASH_QUEUE_DEPTH', 32)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _slots = threading.BoundedSemaphore(workers + queue_depth)
+            _pool_pid = os.getpid()
+        return _pool, _slots
+
+
+def _run(fn, *args):
+    if not current_app.config.get('PASSWORD_HASH_WORKERS', 2):
+        return fn(*args)
+
+    pool, slots = _get_pool()
+    # Reject instead of queueing once the pool is saturated
+    if not slots.acquire(blocking=False):
+        abort(503)  # Service Unavailable
+    try:
+        return pool.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def _generate(password):
+    return generate_password_hash(password, method='pbkdf2:sha256')
+
+
+def hash_password(password):
+    return _run(_generate, password)
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def shutdown_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
+        _slots = None
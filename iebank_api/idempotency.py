@@ -0,0 +1,127 @@
+from flask import current_app, jsonify, request
+from iebank_api import db
+from iebank_api.models import IdempotencyKey
+from sqlalchemy import delete, event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from functools import wraps
+import hashlib
+import json
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 64
+# Stored for a request whose view failed after committing its changes
+APPLIED_BUT_FAILED = {'message': 'The request was applied but its response failed; do not send it again'}
+
+
+def cutoff():
+    # Keys created before this are expired
+    return datetime.utcnow() - timedelta(seconds=current_app.config.get('IDEMPOTENCY_KEY_TTL_SECONDS', 86400))
+
+
+def purge_expired():
+    # Delete expired keys (an index range scan on created_at); returns how many
+    result = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff()))
+    db.session.commit()
+    return result.rowcount
+
+
+def request_hash():
+    # Fingerprint of the request body, so a key reused for another request is caught
+    data = request.get_json(silent=True)
+    body = json.dumps(data, sort_keys=True).encode() if data is not None else request.get_data()
+    return hashlib.sha256(body).hexdigest()
+
+
+def replay(record):
+    response = current_app.response_class(record.response, status=record.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(f):
+    # Run a POST at most once per Idempotency-Key: retries get the stored outcome from a
+    # single primary key lookup instead of running the request again. The key row is
+    # inserted before the view runs, so it commits together with the view's changes
+    # and a concurrent retry blocks on it instead of repeating them. The response is
+    # stored right after. A view that fails (5xx or an error) before committing leaves
+    # no key behind, so it can be retried; once it has committed, the failure is stored
+    # and replayed like any other outcome.
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return f(current_user, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'message': 'Invalid Idempotency-Key'}), 400
+
+        fingerprint = request_hash()
+        record = db.session.get(IdempotencyKey, (current_user.id, key))
+        if record is not None and record.created_at < cutoff():
+            db.session.delete(record)
+            db.session.flush()
+            record = None
+        if record is None:
+            db.session.add(IdempotencyKey(user_id=current_user.id, key=key, endpoint=request.endpoint, request_hash=fingerprint))
+            try:
+                db.session.flush()
+            except IntegrityError:
+                # A concurrent request with the same key got there first
+                db.session.rollback()
+                record = db.session.get(IdempotencyKey, (current_user.id, key))
+            else:
+                return run(key, fingerprint, f, current_user, *args, **kwargs)
+
+        if record is None or record.status_code is None:
+            return jsonify({'message': 'A request with this Idempotency-Key is in progress'}), 409
+        if record.endpoint != request.endpoint or record.request_hash != fingerprint:
+            return jsonify({'message': 'Idempotency-Key was already used for a different request'}), 422
+        return replay(record)
+
+    return decorated
+
+
+@event.listens_for(Session, 'after_commit')
+def note_commit(session):
+    # Lets run() tell whether a view committed before it failed
+    session.info['committed'] = True
+
+
+def run(key, fingerprint, f, current_user, *args, **kwargs):
+    db.session.info.pop('committed', None)
+    try:
+        response = current_app.make_response(f(current_user, *args, **kwargs))
+    except Exception:
+        if db.session.info.pop('committed', False):
+            db.session.rollback()
+            store(current_user.id, key, fingerprint, 500, current_app.json.dumps(APPLIED_BUT_FAILED))
+        else:
+            forget(current_user.id, key)
+        raise
+    if response.status_code >= 500 and not db.session.info.pop('committed', False):
+        forget(current_user.id, key)
+        return response
+
+    store(current_user.id, key, fingerprint, response.status_code, response.get_data(as_text=True))
+    return response
+
+
+def store(user_id, key, fingerprint, status_code, body):
+    # Record the outcome on the key row
+    outcome = {'status_code': status_code, 'response': body}
+    result = db.session.execute(update(IdempotencyKey).where(
+        IdempotencyKey.user_id == user_id, IdempotencyKey.key == key
+    ).values(**outcome).execution_options(synchronize_session=False))
+    if result.rowcount == 0:
+        # The view rolled back (e.g. a failed transfer) and the key row with it
+        db.session.add(IdempotencyKey(user_id=user_id, key=key, endpoint=request.endpoint,
+                                      request_hash=fingerprint, **outcome))
+    db.session.commit()
+
+
+def forget(user_id, key):
+    # Drop the key row of a request that committed nothing
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key))
+    db.session.commit()
@@ -0,0 +1,67 @@
+from flask.json.provider import DefaultJSONProvider
+from datetime import date, datetime, timezone
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stdlib encoder is used instead
+    orjson = None
+
+
+def isoformat(value):
+    # ISO-8601 for dates and datetimes; naive datetimes are stored in UTC, so say so
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat()
+
+
+def _stdlib_default(o):
+    if isinstance(o, date):
+        return isoformat(o)
+    return DefaultJSONProvider.default(o)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # JSON provider encoding with orjson when it is installed (and JSON_USE_ORJSON is
+    # on), otherwise with the stdlib. Both write datetimes as ISO-8601 with a UTC
+    # offset instead of Flask's default RFC 822 dates, and skip ensure_ascii since
+    # responses are UTF-8.
+
+    ensure_ascii = False
+
+    @property
+    def use_orjson(self):
+        return orjson is not None and self._app.config.get('JSON_USE_ORJSON', True)
+
+    def _options(self, indent):
+        options = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return self.dumpb(obj, **kwargs).decode()
+
+    def dumpb(self, obj, **kwargs):
+        # UTF-8 encoded JSON, without the str round trip when orjson does the work
+        indent = kwargs.pop('indent', None)
+        kwargs.pop('separators', None)
+        if self.use_orjson and not kwargs:
+            return orjson.dumps(obj, default=DefaultJSONProvider.default, option=self._options(indent))
+        kwargs.setdefault('default', _stdlib_default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        separators = (', ', ': ') if indent else (',', ':')
+        return json.dumps(obj, indent=indent, separators=separators, **kwargs).encode()
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = 2 if (self.compact is None and self._app.debug) or self.compact is False else None
+        return self._app.response_class(self.dumpb(obj, indent=indent) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,220 @@
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from bisect import bisect_left
+import glob
+import json
+import os
+import threading
+import time
+
+# Upper bounds (seconds) of the request latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER_HELP = {
+    'http_request_errors_total': 'Requests that ended with a 5xx status.',
+    'db_queries_total': 'SQL statements executed while serving requests.',
+    'telemetry_dropped_records_total': 'Log records dropped because the telemetry buffer was full.',
+    'http_response_bytes_total': 'Bytes of response bodies before compression, by content coding.',
+    'http_response_compressed_bytes_total': 'Bytes of response bodies sent after compression, by content coding.',
+    'login_rate_limited_total': 'Login attempts rejected by the rate limiter, by bucket.',
+    'login_lockouts_total': 'Accounts locked after too many failed logins.'
+}
+
+
+class MetricsRegistry:
+    # Process-local request histograms and counters. With a shared METRICS_DIR every
+    # worker periodically writes its snapshot to its own file and a scrape merges all
+    # of them, so /metrics reports the whole server whichever worker answers it.
+
+    def __init__(self, worker_id=None):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._flushed_at = 0.0
+        self.worker_id = worker_id
+
+    def observe_request(self, route, method, status, duration):
+        key = (route, method, str(status))
+        with self._lock:
+            slots = self._histograms.get(key)
+            if slots is None:
+                # One slot per bucket, an overflow (+Inf) slot, then the sum
+                slots = self._histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            slots[bisect_left(BUCKETS, duration)] += 1
+            slots[-1] += duration
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, labels, value):
+        # Set a counter maintained elsewhere (e.g. by a logging handler)
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] = value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'histograms': [list(key) + [list(slots)] for key, slots in self._histograms.items()],
+                'counters': [[name, [list(label) for label in labels], value]
+                             for (name, labels), value in self._counters.items()]
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def _path(self, directory):
+        return os.path.join(directory, f'metrics-{self.worker_id or os.getpid()}.json')
+
+    def flush(self, directory):
+        # Atomically replace this worker's snapshot file
+        path = self._path(directory)
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporary, path)
+        self._flushed_at = time.monotonic()
+
+    def maybe_flush(self, directory, interval):
+        if directory and time.monotonic() - self._flushed_at > interval:
+            self.flush(directory)
+
+    def collect(self, directory=None):
+        # Snapshots of every worker (or just this one without a shared directory)
+        if not directory:
+            return [self.snapshot()]
+        self.flush(directory)
+        snapshots = []
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+
+def archive_worker(directory, worker_id):
+    # Fold an exited worker's snapshot into the archive of all exited workers and drop
+    # its file, so recycled workers leave one file behind instead of one each. Run by
+    # the gunicorn master, the only process that writes the archive.
+    path = os.path.join(directory, f'metrics-{worker_id}.json')
+    archive = os.path.join(directory, 'metrics-archive.json')
+    snapshots = []
+    for source in (archive, path):
+        try:
+            with open(source) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    histograms, counters = merge(snapshots)
+    temporary = f'{archive}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump({
+            'histograms': [list(key) + [slots] for key, slots in histograms.items()],
+            'counters': [[name, [list(label) for label in labels], value] for (name, labels), value in counters.items()]
+        }, f)
+    os.replace(temporary, archive)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def merge(snapshots):
+    histograms = {}
+    counters = {}
+    for snapshot in snapshots:
+        for route, method, status, slots in snapshot['histograms']:
+            merged = histograms.setdefault((route, method, status), [0] * len(slots))
+            for i, value in enumerate(slots):
+                merged[i] += value
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+    return histograms, counters
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render(snapshots):
+    # Prometheus text exposition format
+    histograms, counters = merge(snapshots)
+    lines = [
+        '# HELP http_request_duration_seconds Request latency by route, method and status.',
+        '# TYPE http_request_duration_seconds histogram'
+    ]
+    for (route, method, status), slots in sorted(histograms.items()):
+        labels = [('route', route), ('method', method), ('status', status)]
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), slots[:-1]):
+            cumulative += count
+            lines.append(f'http_request_duration_seconds_bucket{_labels(labels + [("le", bound)])} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{_labels(labels)} {slots[-1]}')
+        lines.append(f'http_request_duration_seconds_count{_labels(labels)} {cumulative}')
+
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f'# HELP {name} {COUNTER_HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} counter')
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f'{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def instrument_queries(engine):
+    # Count the statements run on behalf of the current request and the time spent in
+    # them, logging any statement slower than SLOW_QUERY_THRESHOLD_MS
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        context.query_start = time.perf_counter()
+
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.query_start
+        if not has_app_context():
+            return
+        route = None
+        if has_request_context():
+            g.db_queries = g.get('db_queries', 0) + 1
+            g.db_time = g.get('db_time', 0.0) + elapsed
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+
+        threshold = current_app.config.get('SLOW_QUERY_THRESHOLD_MS')
+        if threshold is not None and elapsed * 1000 >= threshold:
+            current_app.logger.warning('Slow query (%.1f ms) on %s: %s', elapsed * 1000, route, statement[:1000], extra={
+                'custom_dimensions': {
+                    'route': route,
+                    'duration_ms': elapsed * 1000,
+                    'statement': statement[:1000]
+                }
+            })
+
+    event.listen(engine, 'before_cursor_execute', start_query)
+    event.listen(engine, 'after_cursor_execute', end_query)
+
+
+def check_query_budget(app, endpoint, queries):
+    # Compare a request's statement count with its endpoint's budget; over budget it is
+    # logged, or raised when QUERY_BUDGET_ENFORCE is set (as in the test suite)
+    budget = app.config.get('QUERY_BUDGETS', {}).get(endpoint)
+    if budget is None or queries <= budget:
+        return
+    message = f'{endpoint} ran {queries} queries, over its budget of {budget}'
+    if app.config.get('QUERY_BUDGET_ENFORCE'):
+        raise QueryBudgetExceeded(message)
+    app.logger.warning(message)
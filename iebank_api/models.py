@@ -1,4 +1,5 @@
 from iebank_api import db
+from iebank_api.money import Money
 from datetime import datetime, timezone
 import string, random
 
@@ -6,7 +7,7 @@ class Account(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(32), nullable=False)
     account_number = db.Column(db.String(20), nullable=False, unique=True)
-    balance = db.Column(db.Float, nullable=False, default=0.0)
+    balance = db.Column(Money, nullable=False, default=0)
     currency = db.Column(db.String(1), nullable=False, default="EUR")
     country = db.Column(db.String(32), nullable=False, default="Spain")
     status = db.Column(db.String(10), nullable=False, default="Active")
@@ -15,11 +16,15 @@ class Account(db.Model):
     user = db.relationship('User', back_populates='accounts')
     transactions_from = db.relationship('Transaction', foreign_keys='Transaction.from_account_id', back_populates='from_account', cascade='all, delete-orphan')
     transactions_to = db.relationship('Transaction', foreign_keys='Transaction.to_account_id', back_populates='to_account', cascade='all, delete-orphan')
+    __table_args__ = (
+        # Accounts of a user in page order (also serves plain user_id lookups)
+        db.Index('ix_account_user_id_created_at', 'user_id', 'created_at', 'id'),
+    )
 
     def __repr__(self):
         return '<Account %r>' % self.account_number
 
-    def __init__(self, name, currency, country, user_id, balance=0.0):
+    def __init__(self, name, currency, country, user_id, balance=0):
         self.name = name
         self.account_number = ''.join(random.choices(string.digits, k=20))
         self.currency = currency
@@ -39,9 +44,14 @@ class User(db.Model):
     updated_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
     last_login_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
     failed_login_attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_until = db.Column(db.DateTime, nullable=True)  # Set after too many failed logins
     status = db.Column(db.String(10), nullable=False, default="Active")
     role = db.Column(db.Enum('admin', 'user', name='roles'), nullable=False, default='user')
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     accounts = db.relationship('Account', back_populates='user', cascade='all, delete-orphan')
+    __table_args__ = (
+        db.Index('ix_user_created_at', 'created_at', 'id'),
+    )
 
     def __repr__(self):
         return '<User %r>' % self.username
@@ -55,17 +65,24 @@ class User(db.Model):
         self.role = role  # Default value
         self.status = status  # Default value
         self.failed_login_attempts = failed_login_attempts  # Default value
+        self.token_version = 0
 
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     from_account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
-    to_account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    to_account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False, index=True)
+    amount = db.Column(Money, nullable=False)
     currency = db.Column(db.String(3), nullable=False, default="EUR")  # Add currency attribute
     status = db.Column(db.String(10), nullable=False, default="Completed")
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     from_account = db.relationship('Account', foreign_keys=[from_account_id], back_populates='transactions_from')
     to_account = db.relationship('Account', foreign_keys=[to_account_id], back_populates='transactions_to')
+    __table_args__ = (
+        # Outgoing transactions of an account in page order
+        db.Index('ix_transaction_from_account_id_created_at', 'from_account_id', 'created_at', 'id'),
+        # Time range scans for exports
+        db.Index('ix_transaction_created_at', 'created_at', 'id'),
+    )
 
     def __repr__(self):
         return '<Transaction %r>' % self.id
@@ -75,4 +92,61 @@ class Transaction(db.Model):
         self.to_account_id = to_account_id
         self.amount = amount
         self.currency = currency  # Initialize currency
-        
\ No newline at end of file
+        
+
+class UserSummary(db.Model):
+    # Portal figures of a user, kept up to date by iebank_api.summaries in the same
+    # database transaction as the account and transfer changes behind them
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    account_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_activity_at = db.Column(db.DateTime, nullable=True)
+    # Bumped with every change to the user's profile, accounts or transactions (ETags)
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return '<UserSummary %r>' % self.user_id
+
+
+class UserBalance(db.Model):
+    # Total balance of a user's accounts in one currency
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    currency = db.Column(db.String(3), primary_key=True)
+    total = db.Column(Money, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return '<UserBalance %r %s>' % (self.user_id, self.currency)
+
+
+class ExchangeRate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    base_currency = db.Column(db.String(3), nullable=False)
+    quote_currency = db.Column(db.String(3), nullable=False)
+    rate = db.Column(db.Float, nullable=False)  # Units of quote_currency per unit of base_currency
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (db.UniqueConstraint('base_currency', 'quote_currency'),)
+
+    def __repr__(self):
+        return '<ExchangeRate %s/%s>' % (self.base_currency, self.quote_currency)
+
+    def __init__(self, base_currency, quote_currency, rate):
+        self.base_currency = base_currency
+        self.quote_currency = quote_currency
+        self.rate = rate
+
+
+class IdempotencyKey(db.Model):
+    # Outcome of a POST sent with an Idempotency-Key header, replayed to its retries
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    endpoint = db.Column(db.String(64), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)  # None while the request is in progress
+    response = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (
+        # Expired keys are purged by age
+        db.Index('ix_idempotency_key_created_at', 'created_at'),
+    )
+
+    def __repr__(self):
+        return '<IdempotencyKey %r %r>' % (self.user_id, self.key)
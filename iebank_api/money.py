@@ -0,0 +1,49 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+from sqlalchemy.types import TypeDecorator, BigInteger
+
+# Money is handled as Decimal in Python and stored as an integer number of minor
+# units (cents), so arithmetic never accumulates float rounding error and SUM() in
+# SQL is exact
+MINOR_UNITS = 100
+CENT = Decimal('0.01')
+
+
+def to_money(value):
+    # Parse an API or float value into a Decimal rounded to whole cents
+    if isinstance(value, bool):
+        raise ValueError('Invalid amount')
+    try:
+        amount = Decimal(str(value)) if not isinstance(value, Decimal) else value
+        if not amount.is_finite():
+            raise ValueError('Invalid amount')
+        return amount.quantize(CENT, rounding=ROUND_HALF_EVEN)
+    except InvalidOperation:
+        raise ValueError('Invalid amount')
+
+
+def to_minor(value):
+    return int(to_money(value) * MINOR_UNITS)
+
+
+def from_minor(units):
+    return (Decimal(units) / MINOR_UNITS).quantize(CENT)
+
+
+def money_json(value):
+    # JSON number for an amount; every whole-cent value round-trips exactly
+    return float(value)
+
+
+class Money(TypeDecorator):
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return to_minor(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return from_minor(value)
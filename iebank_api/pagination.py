@@ -0,0 +1,66 @@
+from flask import request, abort
+from iebank_api import db
+from sqlalchemy import tuple_
+from datetime import datetime
+import base64
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+
+def encode_cursor(created_at, id):
+    # Opaque cursor pointing at the last row of a page
+    raw = f"{created_at.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, UnicodeDecodeError):
+        abort(400)  # Bad Request
+
+
+def page_args():
+    # Read the limit and cursor query parameters of the current request
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_LIMIT))
+    except ValueError:
+        abort(400)  # Bad Request
+    if limit < 1:
+        abort(400)  # Bad Request
+    limit = min(limit, MAX_PAGE_LIMIT)
+
+    cursor = request.args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def keyset(statement, model, limit, cursor):
+    # Keyset pagination on (created_at, id): every page is an index range scan,
+    # so latency does not grow with the number of rows before the cursor.
+    # One extra row is fetched to tell whether there is a next page.
+    if cursor:
+        statement = statement.where(tuple_(model.created_at, model.id) > cursor)
+    return statement.order_by(model.created_at, model.id).limit(limit + 1)
+
+
+def split_page(rows, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def paginate(statement, model):
+    # Run a select of model rows for the page requested by the current request
+    limit, cursor = page_args()
+    return split_page(db.session.scalars(keyset(statement, model, limit, cursor)).all(), limit)
+
+
+def paginate_rows(statement, model):
+    # Like paginate for a select of plain columns: returns Core rows, so no ORM
+    # instances are built or tracked in the identity map
+    limit, cursor = page_args()
+    return split_page(db.session.execute(keyset(statement, model, limit, cursor)).all(), limit)
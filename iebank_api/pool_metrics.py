@@ -0,0 +1,108 @@
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+import threading
+import time
+
+
+class PoolMetrics:
+    # Process-local gauges and counters describing the connection pool of one engine
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.in_use = 0
+            self.max_in_use = 0
+            self.checkouts = 0
+            self.timeouts = 0
+            self.invalidations = 0
+            self.wait_count = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def observe_wait(self, seconds, timed_out=False):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def checked_out(self):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def invalidated(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        # The engine's current pool: dispose() swaps in a new one
+        pool = self.engine.pool
+        with self._lock:
+            data = {
+                'pool_class': type(pool).__name__,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'checkouts': self.checkouts,
+                'invalidations': self.invalidations,
+                'checkout_wait': {
+                    'count': self.wait_count,
+                    'timeouts': self.timeouts,
+                    'mean_ms': self.wait_total / self.wait_count * 1000 if self.wait_count else 0.0,
+                    'max_ms': self.wait_max * 1000
+                }
+            }
+        if isinstance(pool, QueuePool):
+            data.update(size=pool.size(), checked_in=pool.checkedin(), overflow=pool.overflow())
+        return data
+
+
+# PoolMetrics of each instrumented engine in this process, by pool name
+pools = {}
+
+
+class InstrumentedQueuePool(QueuePool):
+    # QueuePool that records how long each checkout waited for a free connection in
+    # the PoolMetrics instrument_pool gives it
+
+    metrics = None
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            if self.metrics is not None:
+                self.metrics.observe_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        if self.metrics is not None:
+            self.metrics.observe_wait(time.perf_counter() - start)
+        return connection
+
+
+def instrument_pool(engine, name):
+    # Track checked out connections on whatever pool the engine uses, in metrics of
+    # their own so each engine's pool is reported under its name
+    metrics = pools[name] = PoolMetrics(engine)
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.metrics = metrics
+    event.listen(engine, 'checkout', lambda dbapi_connection, record, proxy: metrics.checked_out())
+    event.listen(engine, 'checkin', lambda dbapi_connection, record: metrics.checked_in())
+    event.listen(engine, 'invalidate', lambda dbapi_connection, record, exception: metrics.invalidated())
+    return metrics
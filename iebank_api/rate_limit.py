@@ -0,0 +1,160 @@
+from flask import current_app, request
+from iebank_api.metrics import registry
+import os
+import sqlite3
+import threading
+import time
+
+# Buckets are swept of entries that have refilled completely every this many takes
+SWEEP_EVERY = 1000
+
+
+def consume(state, capacity, rate, now):
+    # Token bucket: refill a (tokens, updated_at) state at rate tokens per second up to
+    # capacity (a missing state is a full bucket), then take one token. Returns the new
+    # token count, when the bucket will be full again, and 0 if a token was taken or
+    # else how many seconds until one is available.
+    tokens = capacity if state is None else min(capacity, state[0] + (now - state[1]) * rate)
+    if tokens >= 1:
+        tokens -= 1
+        retry_after = 0
+    else:
+        retry_after = (1 - tokens) / rate
+    return tokens, now + (capacity - tokens) / rate, retry_after
+
+
+class MemoryBackend:
+    # Buckets in a dict of this process; with several workers each enforces its own limits
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._takes = 0
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            state = self._buckets.get(key)
+            tokens, full_at, retry_after = consume(state and state[:2], capacity, rate, now)
+            self._buckets[key] = (tokens, now, full_at)
+            self._takes += 1
+            if self._takes % SWEEP_EVERY == 0:
+                self._buckets = {key: state for key, state in self._buckets.items() if state[2] > now}
+            return retry_after
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBackend:
+    # Buckets in a SQLite file, shared by every worker process on the host. Each take is
+    # one short write transaction, so concurrent workers see each other's attempts.
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self):
+        # One connection per thread, reopened in forked workers
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS bucket '
+                               '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, key, capacity, rate, now):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            state = connection.execute('SELECT tokens, updated_at FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens, full_at, retry_after = consume(state, capacity, rate, now)
+            connection.execute('INSERT INTO bucket (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?) '
+                               'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, '
+                               'updated_at = excluded.updated_at, full_at = excluded.full_at',
+                               (key, tokens, now, full_at))
+            self._takes += 1
+            if self._takes % SWEEP_EVERY == 0:
+                connection.execute('DELETE FROM bucket WHERE full_at <= ?', (now,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return retry_after
+
+    def reset(self):
+        self._connection().execute('DELETE FROM bucket')
+
+
+def make_backend(storage):
+    # LOGIN_RATE_LIMIT_STORAGE: 'memory', 'sqlite:///<path>', or an object with the
+    # take(key, capacity, rate, now) and reset() methods of the backends above
+    if not isinstance(storage, str):
+        return storage
+    if storage == 'memory':
+        return MemoryBackend()
+    if storage.startswith('sqlite:///'):
+        return SQLiteBackend(storage[len('sqlite:///'):])
+    raise ValueError(f'Unsupported LOGIN_RATE_LIMIT_STORAGE: {storage}')
+
+
+class LoginRateLimiter:
+    # Token buckets per client IP and per username for /login, checked before any
+    # database lookup or password hash, so a burst of guesses costs no pbkdf2 CPU.
+
+    def __init__(self):
+        self._backend = None
+        self._storage = None
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def client_address(self):
+        # Client IP to throttle by, or None when it cannot be trusted: a request that came
+        # through a proxy the app was not told about (PROXY_COUNT) carries the proxy's
+        # address, which every client behind it would share
+        if request.headers.get('X-Forwarded-For') and not current_app.config.get('PROXY_COUNT'):
+            if not self._warned:
+                self._warned = True
+                current_app.logger.warning('Requests arrive through a proxy but PROXY_COUNT is not set; '
+                                           '/login is only rate limited per username')
+            return None
+        return request.remote_addr
+
+    def backend(self):
+        storage = current_app.config.get('LOGIN_RATE_LIMIT_STORAGE', 'memory')
+        with self._lock:
+            if self._backend is None or storage != self._storage:
+                self._backend = make_backend(storage)
+                self._storage = storage
+            return self._backend
+
+    def check(self, ip, username):
+        # Seconds the client should wait before trying again, or 0 to let it through.
+        # The IP bucket is checked first so one address cannot drain a username's bucket
+        # any faster than its own allows; it is skipped when ip is None.
+        if not current_app.config.get('LOGIN_RATE_LIMIT_ENABLED', True):
+            return 0
+        limits = current_app.config.get('LOGIN_RATE_LIMITS', {'ip': (30, 60), 'username': (5, 5)})
+        backend = self.backend()
+        now = time.time()
+        for scope, value in (('ip', ip), ('username', username.lower())):
+            if value is None:
+                continue
+            capacity, per_minute = limits[scope]
+            retry_after = backend.take(f'{scope}:{value}', capacity, per_minute / 60, now)
+            if retry_after:
+                registry.inc('login_rate_limited_total', {'scope': scope})
+                return retry_after
+        return 0
+
+    def reset(self):
+        with self._lock:
+            if self._backend is not None:
+                self._backend.reset()
+
+
+login_limiter = LoginRateLimiter()
@@ -1,37 +1,89 @@
-from flask import Flask, request, abort, jsonify
-from iebank_api import db, app
-from iebank_api.models import Account, User, Transaction
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
-import jwt
+from flask import Blueprint, current_app, request, abort, jsonify, g, Response, stream_with_context
+from iebank_api import db
+from iebank_api.models import Account, User, Transaction, UserBalance, UserSummary
+from iebank_api.pagination import paginate, paginate_rows
+from iebank_api.conditional import conditional
+from iebank_api.idempotency import idempotent
+from iebank_api.rate_limit import login_limiter
+from iebank_api.auth import TokenError, authorize, decode_token, encode_token, token_versions
+from iebank_api.hashing import hash_password, verify_password
+from iebank_api.transfers import (ConcurrentUpdateError, TransferError, convert, parse_amount, parse_currency, transfer,
+                                  transfer_batch)
+from iebank_api.money import Money, to_money, money_json
+from iebank_api.pool_metrics import pools
+from iebank_api.telemetry import dropped_records, sampled
+from iebank_api.metrics import check_query_budget, registry, render
+from iebank_api.json_provider import isoformat
+from werkzeug.exceptions import HTTPException
+from sqlalchemy import case, literal, select, union_all, update
+from sqlalchemy.orm import aliased, contains_eager, joinedload
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 import logging
-from opencensus.ext.azure.log_exporter import AzureLogHandler
+import math
 import time
+import csv
+import io
+
+api = Blueprint('api', __name__)
+
+# Columns read by the list endpoints: what format_user / format_account serialize plus
+# created_at for the page cursor. Selecting them as Core rows skips the other columns
+# (e.g. password hashes) and the cost of building and tracking ORM instances.
+USER_COLUMNS = (User.id, User.username, User.email, User.country, User.date_of_birth, User.role, User.status,
+                User.created_at)
+ACCOUNT_COLUMNS = (Account.id, Account.name, Account.account_number, Account.balance, Account.currency,
+                   Account.status, Account.created_at, Account.country)
 
 # Configure Azure Application Insights
-@app.before_request
+@api.before_app_request
 def start_timer():
-    request.start_time = time.time()
+    request.start_time = time.perf_counter()
+    # The app context (and g) can outlive a request, e.g. in tests, so reset the query stats
+    g.db_queries = 0
+    g.db_time = 0.0
 
-@app.after_request
+@api.after_app_request
 def log_request(response):
     if request.path == '/favicon.ico':
         return response
 
     # Calculate the duration of the request
-    duration = time.time() - request.start_time
-
-    # Log the request details
-    app.logger.info(f"{request.method} {request.path} {response.status_code} {duration:.6f}s")
+    duration = time.perf_counter() - request.start_time
+
+    # Record it in the latency histogram of its route, with its queries and failures
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    registry.observe_request(route, request.method, response.status_code, duration)
+    registry.inc('db_queries_total', {'route': route}, g.get('db_queries', 0))
+    if response.status_code >= 500:
+        registry.inc('http_request_errors_total', {'route': route, 'status': str(response.status_code)})
+    registry.maybe_flush(current_app.config.get('METRICS_DIR'), current_app.config.get('METRICS_FLUSH_SECONDS', 5))
+
+    # Expose the request's database work outside production and hold it to its budget
+    if current_app.config.get('QUERY_STATS_HEADERS'):
+        response.headers['X-DB-Query-Count'] = str(g.get('db_queries', 0))
+        response.headers['X-DB-Time-Ms'] = f"{g.get('db_time', 0.0) * 1000:.2f}"
+    check_query_budget(current_app, request.endpoint, g.get('db_queries', 0))
+
+    # Log the request details as a structured record, sampling busy routes
+    logger = current_app.logger
+    if logger.isEnabledFor(logging.INFO) and sampled(current_app, request.endpoint, response.status_code):
+        logger.info('%s %s %s %.6fs', request.method, request.path, response.status_code, duration, extra={
+            'custom_dimensions': {
+                'method': request.method,
+                'route': route,
+                'status_code': response.status_code,
+                'duration': duration
+            }
+        })
     return response
 
-@app.route('/')
+@api.route('/')
 def hello_world():
     # Basic route to check if the server is running
     return 'Hello, World!'
 
-@app.route('/skull', methods=['GET'])
+@api.route('/skull', methods=['GET'])
 def skull():
     # Route to display database connection details
     text = 'Hi! This is the BACKEND SKULL! 💀 '
@@ -46,7 +98,7 @@ def skull():
         text = text +'<br/>Database password:' + db.engine.url.password
     return text
 
-@app.route('/register', methods=['POST'])
+@api.route('/register', methods=['POST'])
 def register():
     # Route to register a new user
     data = request.get_json()
@@ -54,7 +106,7 @@ def register():
     if not data or not all(field in data for field in required_fields):
         abort(500)
 
-    hashed_password = generate_password_hash(data['password'], method='pbkdf2:sha256')
+    hashed_password = hash_password(data['password'])
 
     # Convert date_of_birth to a datetime object
     date_of_birth = datetime.strptime(data['date_of_birth'], '%Y-%m-%d')
@@ -72,7 +124,7 @@ def register():
 
     return format_user(new_user)
 
-@app.route('/login', methods=['POST'])
+@api.route('/login', methods=['POST'])
 def login():
     try:
         data = request.get_json()
@@ -80,18 +132,26 @@ def login():
         if not data or not all(field in data for field in required_fields):
             abort(400)  # Bad Request
 
+        # Throttle guesses per client and per username before any lookup or hashing
+        retry_after = login_limiter.check(login_limiter.client_address(), str(data['username']))
+        if retry_after:
+            return jsonify({'message': 'Too many login attempts, try again later'}), 429, \
+                {'Retry-After': str(math.ceil(retry_after))}
+
         user = User.query.filter_by(username=data['username']).first()
         if not user:
             abort(401)  # Unauthorized
 
-        if check_password_hash(user.password, data['password']):
+        now = datetime.utcnow()
+        if user.locked_until and user.locked_until > now:
+            return jsonify({'message': 'Account locked after too many failed logins, try again later'}), 423, \
+                {'Retry-After': str(math.ceil((user.locked_until - now).total_seconds()))}
+
+        if verify_password(user.password, data['password']):
             # Generate JWT token
-            token = jwt.encode({
-                'user_id': user.id,
-                'exp': datetime.utcnow() + timedelta(hours=24)
-            }, app.config['SECRET_KEY'], algorithm='HS256')
+            token = encode_token(user)
 
-            return jsonify({
+            response = jsonify({
                 'message': 'Login successful',
                 'token': token,
                 'user': {
@@ -101,11 +161,20 @@ def login():
                     'role': user.role,
                     'status': user.status,
                     'country': user.country,
-                    'date_of_birth': user.date_of_birth.isoformat()
+                    'date_of_birth': user.date_of_birth
                 }
-            }), 200
+            })
+            if user.failed_login_attempts or user.locked_until:
+                # Start counting failures afresh
+                user.failed_login_attempts = 0
+                user.locked_until = None
+                db.session.commit()
+            return response, 200
         else:
+            record_failed_login(user.id, now)
             abort(401)  # Unauthorized
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error during login: {e}")
         abort(500)  # Internal Server Error
@@ -118,17 +187,13 @@ def token_required(f):
             return jsonify({'message': 'Token is missing!'}), 401
 
         try:
-            # Decode the token
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.filter_by(id=data['user_id']).first()
-
-            if not current_user:
-                return jsonify({'message': 'User not found!'}), 401
+            # Decode the token and authorize from its claims, checking only that
+            # the token version has not been revoked since it was issued
+            data = decode_token(token)
+            current_user = authorize(data, token_versions.get(data['user_id']))
 
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Token is invalid!'}), 401
+        except TokenError as e:
+            return jsonify({'message': str(e)}), 401
         except Exception as e:
             print(f"Error decoding token: {e}")
             return jsonify({'message': 'An error occurred during token validation.'}), 401
@@ -138,33 +203,33 @@ def token_required(f):
     return decorated
 
 
-@app.route('/user_portal', methods=['GET'])
+@api.route('/user_portal', methods=['GET'])
 @token_required
+@conditional
 def user_portal(current_user):
-    # Route to display the user portal with accounts and transactions
-    accounts = Account.query.filter_by(user_id=current_user.id).all()
-    transactions = Transaction.query.join(Account, Transaction.from_account_id == Account.id).filter(Account.user_id == current_user.id).all()
-
-    return {
-        'user': format_user(current_user),
-        'accounts': [format_account(account) for account in accounts],
-        'transactions': [format_transaction(transaction) for transaction in transactions]
-    }
-
-@app.route('/admin_portal', methods=['GET'])
+    # Route to display the user portal from the user's maintained summary and their
+    # most recent transactions; the full lists are paginated under /accounts and /transactions
+    user, summary = db.session.execute(portal_user(current_user.id)).one()
+    balances = db.session.scalars(user_balances(current_user.id)).all()
+    transactions = db.session.scalars(recent_transactions(current_user.id)).all()
+    return format_portal(user, summary, balances, transactions)
+
+@api.route('/admin_portal', methods=['GET'])
 @token_required
 def admin_portal(current_user):
     # Route to display the admin portal with all users
     if current_user.role != 'admin':
         abort(401)  # Unauthorized
 
-    users = User.query.all()
+    users, next_cursor = paginate_rows(select(*USER_COLUMNS), User)
     return {
-        'users': [format_user(user) for user in users]
+        'users': [format_user(user) for user in users],
+        'next_cursor': next_cursor
     }
 
-@app.route('/accounts', methods=['POST'])
+@api.route('/accounts', methods=['POST'])
 @token_required
+@idempotent
 def create_account(current_user):
     # Route to create a new account
     data = request.get_json()
@@ -174,22 +239,26 @@ def create_account(current_user):
 
     name = data['name']
     currency = data['currency']
-    balance = data['balance']
     country = data['country']
+    try:
+        balance = to_money(data['balance'])
+    except ValueError:
+        abort(400)  # Bad Request
 
     account = Account(name=name, currency=currency, balance=balance, country=country, user_id=current_user.id)
     db.session.add(account)
     db.session.commit()
     return format_account(account)
 
-@app.route('/accounts', methods=['GET'])
+@api.route('/accounts', methods=['GET'])
 @token_required
+@conditional
 def get_accounts(current_user):
-    # Route to get all accounts for the logged-in user
-    accounts = Account.query.filter_by(user_id=current_user.id).all()
-    return {'accounts': [format_account(account) for account in accounts]}
+    # Route to get a page of accounts for the logged-in user
+    accounts, next_cursor = paginate_rows(user_accounts(current_user.id), Account)
+    return {'accounts': [format_account(account) for account in accounts], 'next_cursor': next_cursor}
 
-@app.route('/accounts/<int:id>', methods=['GET'])
+@api.route('/accounts/<int:id>', methods=['GET'])
 @token_required
 def get_account(current_user, id):
     # Route to get a specific account by ID
@@ -198,7 +267,7 @@ def get_account(current_user, id):
         abort(500)
     return format_account(account)
 
-@app.route('/accounts/<int:id>', methods=['PUT'])
+@api.route('/accounts/<int:id>', methods=['PUT'])
 @token_required
 def update_account(current_user, id):
     # Route to update a specific account by ID
@@ -209,7 +278,7 @@ def update_account(current_user, id):
     db.session.commit()
     return format_account(account)
 
-@app.route('/accounts/<int:id>', methods=['DELETE'])
+@api.route('/accounts/<int:id>', methods=['DELETE'])
 @token_required
 def delete_account(current_user, id):
     # Route to delete a specific account by ID
@@ -220,78 +289,264 @@ def delete_account(current_user, id):
     db.session.commit()
     return format_account(account)
 
-@app.route('/transactions', methods=['POST'])
+@api.route('/transactions', methods=['POST'])
 @token_required
+@idempotent
 def create_transaction(current_user):
     data = request.get_json()
-    app.logger.info(f"Received data: {data}")
     required_fields = ['from_account_number', 'to_account_number', 'amount', 'currency']
     if not data or not all(field in data for field in required_fields):
-        app.logger.error("Missing required fields")
+        current_app.logger.error("Missing required fields")
         return jsonify({'message': 'Missing required fields'}), 400
 
     from_account_number = data['from_account_number']
     to_account_number = data['to_account_number']
-    amount = data['amount']
-    transaction_currency = data['currency']
+    try:
+        amount = parse_amount(data['amount'])
+        transaction_currency = parse_currency(data['currency'])
+    except TransferError as e:
+        current_app.logger.error(str(e))
+        return jsonify({'message': str(e)}), 400
 
     from_account = Account.query.filter_by(account_number=from_account_number).first()
     to_account = Account.query.filter_by(account_number=to_account_number).first()
     if not from_account or from_account.user_id != current_user.id or not to_account:
-        app.logger.error("Invalid account details")
+        current_app.logger.error("Invalid account details")
         return jsonify({'message': 'Invalid account details'}), 400
 
     # Handle currency conversion
-    if from_account.currency != transaction_currency:
-        if from_account.currency == 'USD' and transaction_currency == 'EUR':
-            converted_amount = amount / 0.95  # Convert EUR to USD
-        elif from_account.currency == 'EUR' and transaction_currency == 'USD':
-            converted_amount = amount * 0.95  # Convert USD to EUR
-        else:
-            app.logger.error("Unsupported currency conversion")
-            return jsonify({'message': 'Unsupported currency conversion!'}), 400
-    else:
-        converted_amount = amount
-
-    if from_account.balance < converted_amount:
-        app.logger.error("Insufficient funds")
-        return jsonify({'message': 'Insufficient funds!'}), 400
-
-    # Update account balances
-    from_account.balance -= converted_amount
-    if to_account.currency != transaction_currency:
-        if transaction_currency == 'USD' and to_account.currency == 'EUR':
-            received_amount = amount * 0.95  # Convert USD to EUR
-        elif transaction_currency == 'EUR' and to_account.currency == 'USD':
-            received_amount = amount / 0.95  # Convert EUR to USD
-        else:
-            app.logger.error("Unsupported currency conversion")
-            return jsonify({'message': 'Unsupported currency conversion!'}), 400
-    else:
-        received_amount = amount
-
-    to_account.balance += received_amount
+    try:
+        converted_amount = convert(amount, transaction_currency, from_account.currency)
+        received_amount = convert(amount, transaction_currency, to_account.currency)
+    except TransferError as e:
+        current_app.logger.error("Unsupported currency conversion")
+        return jsonify({'message': str(e)}), 400
 
-    # Create the transaction
-    transaction = Transaction(from_account_id=from_account.id, to_account_id=to_account.id, amount=amount, currency=transaction_currency)
-    db.session.add(transaction)
-    db.session.commit()
+    # Update account balances and create the transaction atomically
+    try:
+        transaction = transfer(from_account, to_account, converted_amount, received_amount, amount, transaction_currency)
+    except TransferError as e:
+        current_app.logger.error(str(e))
+        return jsonify({'message': str(e)}), 400
 
-    app.logger.info("Transaction successful")
+    current_app.logger.info('Transaction successful', extra={
+        'custom_dimensions': {'transaction_id': transaction.id, 'currency': transaction_currency}
+    })
     return jsonify({
         'transaction': format_transaction(transaction),
         'message': 'Transaction successful!'
     })
 
-@app.route('/transactions', methods=['GET'])
+@api.route('/transactions/batch', methods=['POST'])
 @token_required
+def create_transactions_batch(current_user):
+    # Route to apply many transfers in one request, either all-or-nothing or best-effort
+    data = request.get_json()
+    if not data or not isinstance(data.get('transfers'), list) or not data['transfers']:
+        return jsonify({'message': 'Missing required fields'}), 400
+    mode = data.get('mode', 'atomic')
+    if mode not in ('atomic', 'best_effort'):
+        return jsonify({'message': 'Invalid mode'}), 400
+    if len(data['transfers']) > current_app.config.get('TRANSACTION_BATCH_MAX_SIZE', 5000):
+        return jsonify({'message': 'Too many transfers in one batch'}), 400
+
+    try:
+        results, committed = transfer_batch(current_user.id, data['transfers'], atomic=mode == 'atomic')
+    except ConcurrentUpdateError as e:
+        current_app.logger.error(str(e))
+        return jsonify({'message': str(e)}), 409
+
+    # Format before committing, while the new rows and their accounts are still loaded
+    for result in results:
+        if 'transaction' in result:
+            result['transaction'] = format_transaction(result['transaction'])
+    if committed:
+        db.session.commit()
+    succeeded = sum(result['status'] == 'succeeded' for result in results)
+    current_app.logger.info('Batch of %d transfers: %d succeeded', len(results), succeeded, extra={
+        'custom_dimensions': {'transfers': len(results), 'succeeded': succeeded, 'mode': mode}
+    })
+    return jsonify({
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'message': 'Batch applied' if committed else 'Batch rejected'
+    }), 200 if committed or mode == 'best_effort' else 400
+
+@api.route('/transactions', methods=['GET'])
+@token_required
+@conditional
 def get_transactions(current_user):
-    # Route to get all transactions for the logged-in user
-    transactions = Transaction.query.join(Account, Transaction.from_account_id == Account.id).filter(Account.user_id == current_user.id).all()
-    return {'transactions': [format_transaction(transaction) for transaction in transactions]}
+    # Route to get a page of transactions for the logged-in user
+    transactions, next_cursor = paginate(user_transactions(current_user.id), Transaction)
+    return {'transactions': [format_transaction(transaction) for transaction in transactions], 'next_cursor': next_cursor}
+
+
+EXPORT_FIELDS = ['id', 'from_account', 'to_account', 'amount', 'currency', 'status', 'created_at']
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_time(name):
+    # Optional ISO 8601 query parameter as naive UTC, the way created_at is stored
+    if name not in request.args:
+        return None
+    value = datetime.fromisoformat(request.args[name])
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def export_query(since, until):
+    # Project only the exported columns so no ORM objects are built per row
+    from_account = aliased(Account)
+    to_account = aliased(Account)
+    query = select(
+        Transaction.id,
+        from_account.account_number.label('from_account'),
+        to_account.account_number.label('to_account'),
+        Transaction.amount,
+        Transaction.currency,
+        Transaction.status,
+        Transaction.created_at
+    ).join(from_account, Transaction.from_account_id == from_account.id) \
+        .join(to_account, Transaction.to_account_id == to_account.id) \
+        .order_by(Transaction.created_at, Transaction.id)
+    if since:
+        query = query.where(Transaction.created_at >= since)
+    if until:
+        query = query.where(Transaction.created_at < until)
+    return query
+
+
+def export_chunks(query, export_format):
+    # yield_per streams from a server-side cursor, keeping memory bounded by the batch size
+    result = db.session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == 'csv':
+        yield ','.join(EXPORT_FIELDS) + '\r\n'
+    for partition in result.partitions():
+        for row in partition:
+            record = row._asdict()
+            record['amount'] = money_json(record['amount'])
+            record['created_at'] = isoformat(record['created_at'])
+            if export_format == 'csv':
+                writer.writerow([record[field] for field in EXPORT_FIELDS])
+            else:
+                buffer.write(current_app.json.dumps(record) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+@api.route('/admin/transactions/export', methods=['GET'])
+@token_required
+def export_transactions(current_user):
+    # Route for admin to stream every transaction as NDJSON or CSV
+    if current_user.role != 'admin':
+        abort(401)  # Unauthorized
 
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        abort(400)  # Bad Request
 
-@app.route('/admin/users', methods=['POST'])
+    try:
+        query = export_query(export_time('since'), export_time('until'))
+    except ValueError:
+        abort(400)  # Bad Request
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(export_chunks(query, export_format)), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=transactions.{export_format}'
+    })
+
+
+@api.route('/admin/reconciliation', methods=['GET'])
+@token_required
+def reconciliation(current_user):
+    # Route for admin to verify balances with exact SQL aggregates over the stored minor units
+    if current_user.role != 'admin':
+        abort(401)  # Unauthorized
+
+    balances = db.session.execute(
+        select(
+            Account.currency,
+            db.func.count(Account.id).label('accounts'),
+            db.func.sum(Account.balance).label('total_balance'),
+            db.func.count(Account.id).filter(Account.balance < 0).label('negative_balances')
+        ).group_by(Account.currency).order_by(Account.currency)
+    ).all()
+    volumes = db.session.execute(
+        select(
+            Transaction.currency,
+            db.func.count(Transaction.id).label('transactions'),
+            db.func.sum(Transaction.amount).label('total_amount')
+        ).group_by(Transaction.currency).order_by(Transaction.currency)
+    ).all()
+
+    # Maintained per-user totals that no longer match the sum of the user's accounts
+    amounts = union_all(
+        select(Account.user_id, Account.currency, Account.balance.label('accounts_total'),
+               literal(0, Money).label('summary_total')),
+        select(UserBalance.user_id, UserBalance.currency, literal(0, Money), UserBalance.total)
+    ).subquery()
+    accounts_total = db.func.sum(amounts.c.accounts_total)
+    summary_total = db.func.sum(amounts.c.summary_total)
+    mismatches = db.session.execute(
+        select(amounts.c.user_id, amounts.c.currency, accounts_total.label('accounts_total'), summary_total.label('summary_total'))
+        .group_by(amounts.c.user_id, amounts.c.currency)
+        .having(accounts_total != summary_total)
+        .order_by(amounts.c.user_id, amounts.c.currency)
+    ).all()
+
+    return {
+        'balances': [{
+            'currency': row.currency,
+            'accounts': row.accounts,
+            'total_balance': money_json(row.total_balance),
+            'negative_balances': row.negative_balances
+        } for row in balances],
+        'transactions': [{
+            'currency': row.currency,
+            'transactions': row.transactions,
+            'total_amount': money_json(row.total_amount)
+        } for row in volumes],
+        'summary_mismatches': [{
+            'user_id': row.user_id,
+            'currency': row.currency,
+            'accounts_total': money_json(row.accounts_total),
+            'summary_total': money_json(row.summary_total)
+        } for row in mismatches],
+        'consistent': all(row.negative_balances == 0 for row in balances) and not mismatches
+    }
+
+
+@api.route('/admin/metrics/pool', methods=['GET'])
+@token_required
+def pool_metrics_report(current_user):
+    # Route for admin to read the connection pool gauges of this worker, per engine
+    if current_user.role != 'admin':
+        abort(401)  # Unauthorized
+
+    return {
+        'engine_options': {key: value for key, value in current_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).items()
+                           if key not in ('poolclass', 'connect_args')},
+        'pools': {name: metrics.snapshot() for name, metrics in pools.items()}
+    }
+
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus scrape endpoint, aggregated over every worker sharing METRICS_DIR
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+
+    registry.set('telemetry_dropped_records_total', {}, dropped_records(current_app))
+    snapshots = registry.collect(current_app.config.get('METRICS_DIR'))
+    return Response(render(snapshots), mimetype='text/plain; version=0.0.4')
+
+
+@api.route('/admin/users', methods=['POST'])
 @token_required
 def create_user(current_user):
     # Route for admin to create a new user
@@ -303,7 +558,7 @@ def create_user(current_user):
     if not data or not all(field in data for field in required_fields):
         abort(500)
 
-    hashed_password = generate_password_hash(data['password'], method='pbkdf2:sha256')
+    hashed_password = hash_password(data['password'])
 
     # Convert date_of_birth to a datetime object
     date_of_birth = datetime.strptime(data['date_of_birth'], '%Y-%m-%d')
@@ -323,7 +578,7 @@ def create_user(current_user):
 
     return format_user(new_user)
 
-@app.route('/admin/users/<int:id>', methods=['PUT'])
+@api.route('/admin/users/<int:id>', methods=['PUT'])
 @token_required
 def update_user(current_user, id):
     # Route for admin to update a user by ID
@@ -337,15 +592,18 @@ def update_user(current_user, id):
     user.username = request.json['username']
     user.email = request.json['email']
     if 'password' in request.json and request.json['password']:
-        user.password = generate_password_hash(request.json['password'], method='pbkdf2:sha256')
+        user.password = hash_password(request.json['password'])
     user.country = request.json['country']
     user.date_of_birth = datetime.strptime(request.json['date_of_birth'], '%Y-%m-%d')
     user.role = request.json['role']
     user.status = request.json['status']
+    # Revoke the tokens issued with the previous details
+    user.token_version += 1
     db.session.commit()
+    token_versions.set(user.id, user.token_version)
     return format_user(user)
 
-@app.route('/admin/users/<int:id>', methods=['DELETE'])
+@api.route('/admin/users/<int:id>', methods=['DELETE'])
 @token_required
 def delete_user(current_user, id):
     # Route for admin to delete a user by ID
@@ -357,15 +615,57 @@ def delete_user(current_user, id):
         abort(500)
     db.session.delete(user)
     db.session.commit()
+    token_versions.set(user.id, None)
     return format_user(user)
 
+def record_failed_login(user_id, now):
+    # Helper to count a failed login in one statement, locking the account (and starting
+    # the count over) once MAX_FAILED_LOGIN_ATTEMPTS failures in a row are reached
+    attempts = User.failed_login_attempts + 1
+    lock = attempts >= current_app.config.get('MAX_FAILED_LOGIN_ATTEMPTS', 5)
+    locked_until = now + timedelta(seconds=current_app.config.get('LOGIN_LOCKOUT_SECONDS', 900))
+    remaining = db.session.execute(
+        update(User).where(User.id == user_id).values(
+            failed_login_attempts=case((lock, 0), else_=attempts),
+            locked_until=case((lock, locked_until), else_=User.locked_until)
+        ).returning(User.failed_login_attempts).execution_options(synchronize_session=False)
+    ).scalar()
+    db.session.commit()
+    if remaining == 0:
+        registry.inc('login_lockouts_total', {})
+
+def user_accounts(user_id):
+    # Helper to select the serialized columns of a user's accounts
+    return select(*ACCOUNT_COLUMNS).where(Account.user_id == user_id)
+
+def user_transactions(user_id):
+    # Helper to select the outgoing transactions of a user together with both accounts,
+    # so format_transaction does not issue extra SELECTs per row
+    return select(Transaction) \
+        .join(Account, Transaction.from_account_id == Account.id) \
+        .where(Account.user_id == user_id) \
+        .options(contains_eager(Transaction.from_account), joinedload(Transaction.to_account))
+
+def portal_user(user_id):
+    # Helper to select a user together with their maintained summary (None until they have one)
+    return select(User, UserSummary).outerjoin(UserSummary, UserSummary.user_id == User.id).where(User.id == user_id)
+
+def user_balances(user_id):
+    return select(UserBalance).where(UserBalance.user_id == user_id).order_by(UserBalance.currency)
+
+def recent_transactions(user_id):
+    # Helper to select the most recent transactions shown on the user portal
+    return user_transactions(user_id) \
+        .order_by(Transaction.created_at.desc(), Transaction.id.desc()) \
+        .limit(current_app.config.get('PORTAL_RECENT_TRANSACTIONS', 10))
+
 def format_account(account):
     # Helper function to format account data
     return {
         'id': account.id,
         'name': account.name,
         'account_number': account.account_number,
-        'balance': account.balance,
+        'balance': money_json(account.balance),
         'currency': account.currency,
         'status': account.status,
         'created_at': account.created_at,
@@ -384,11 +684,23 @@ def format_user(user):
         'status': user.status
     }
 
+def format_portal(user, summary, balances, transactions):
+    # Helper function to format the user portal
+    return {
+        'user': format_user(user),
+        'summary': {
+            'account_count': summary.account_count if summary else 0,
+            'balances': {balance.currency: money_json(balance.total) for balance in balances},
+            'last_activity_at': summary.last_activity_at if summary else None
+        },
+        'transactions': [format_transaction(transaction) for transaction in transactions]
+    }
+
 def format_transaction(transaction):
     # Helper function to format transaction data
     return {
         'id': transaction.id,
-        'amount': transaction.amount,
+        'amount': money_json(transaction.amount),
         'currency': transaction.from_account.currency,
         'status': transaction.status,
         'created_at': transaction.created_at,
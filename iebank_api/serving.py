@@ -0,0 +1,25 @@
+from iebank_api import db, start_app_insights
+from iebank_api.metrics import registry
+from iebank_api.pool_metrics import pools
+from iebank_api.telemetry import detach_telemetry
+import os
+
+
+def cpu_count():
+    # CPUs this process may run on (respects container CPU sets, unlike os.cpu_count)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def init_worker(app):
+    # Reset per-process state a forked worker inherited from the preloading master
+    with app.app_context():
+        # Leave the parent's pooled connections alone and open fresh ones in this process
+        db.engine.dispose(close=False)
+    for metrics in pools.values():
+        metrics.reset()
+    registry.reset()
+    if detach_telemetry(app):
+        start_app_insights(app)
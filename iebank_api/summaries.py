@@ -0,0 +1,145 @@
+from iebank_api.models import Account, Transaction, User, UserBalance, UserSummary
+from iebank_api.money import to_money
+from sqlalchemy import and_, delete, event, func, inspect, literal, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timezone
+
+summaries = UserSummary.__table__
+balances = UserBalance.__table__
+
+# User columns returned by the user portal
+PORTAL_USER_FIELDS = ('username', 'email', 'country', 'date_of_birth', 'role', 'status')
+
+
+def _insert(connection, table):
+    # INSERT ... ON CONFLICT DO UPDATE is spelled the same on PostgreSQL and SQLite
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(table)
+
+
+def apply_changes(connection, balance_changes, account_changes=None):
+    # Fold balance deltas {(user_id, currency): amount} and account count deltas
+    # {user_id: count} into the users' summaries, one upsert per table, and bump the
+    # data version of every user involved. Rows are written in key order so
+    # concurrent transfers lock them in the same order.
+    account_changes = account_changes or {}
+    users = sorted({user_id for user_id, _ in balance_changes} | set(account_changes))
+    if not users:
+        return
+    now = datetime.now(timezone.utc)
+
+    statement = _insert(connection, summaries).values([
+        {'user_id': user_id, 'account_count': account_changes.get(user_id, 0), 'last_activity_at': now, 'data_version': 1}
+        for user_id in users
+    ])
+    connection.execute(statement.on_conflict_do_update(index_elements=['user_id'], set_={
+        'account_count': summaries.c.account_count + statement.excluded.account_count,
+        'last_activity_at': statement.excluded.last_activity_at,
+        'data_version': summaries.c.data_version + 1
+    }))
+
+    if balance_changes:
+        statement = _insert(connection, balances).values([
+            {'user_id': user_id, 'currency': currency, 'total': to_money(amount)}
+            for (user_id, currency), amount in sorted(balance_changes.items())
+        ])
+        connection.execute(statement.on_conflict_do_update(index_elements=['user_id', 'currency'], set_={
+            'total': balances.c.total + statement.excluded.total
+        }))
+
+
+def touch(connection, user_ids):
+    # Bump the data version of users whose data changed without moving any totals
+    if not user_ids:
+        return
+    statement = _insert(connection, summaries).values([
+        {'user_id': user_id, 'account_count': 0, 'data_version': 1} for user_id in sorted(user_ids)
+    ])
+    connection.execute(statement.on_conflict_do_update(index_elements=['user_id'], set_={
+        'data_version': summaries.c.data_version + 1
+    }))
+
+
+def rebuild(connection):
+    # Recompute every summary from the accounts and transactions tables. Data versions
+    # start above every previous one, so no ETag handed out before matches again.
+    version = connection.scalar(select(func.coalesce(func.max(summaries.c.data_version), 0))) + 1
+    connection.execute(delete(balances))
+    connection.execute(delete(summaries))
+    connection.execute(balances.insert().from_select(
+        ['user_id', 'currency', 'total'],
+        select(Account.user_id, Account.currency, func.sum(Account.balance)).group_by(Account.user_id, Account.currency)
+    ))
+    connection.execute(summaries.insert().from_select(
+        ['user_id', 'account_count', 'last_activity_at', 'data_version'],
+        select(User.id, func.count(Account.id), func.max(Account.created_at), literal(version))
+        .outerjoin(Account, Account.user_id == User.id).group_by(User.id)
+    ))
+
+    # Transfers in or out of any of the user's accounts are activity too
+    latest_transfer = select(func.max(Transaction.created_at)).join(
+        Account, or_(Transaction.from_account_id == Account.id, Transaction.to_account_id == Account.id)
+    ).where(Account.user_id == summaries.c.user_id).scalar_subquery()
+    connection.execute(update(summaries).where(and_(
+        latest_transfer.is_not(None),
+        or_(summaries.c.last_activity_at.is_(None), latest_transfer > summaries.c.last_activity_at)
+    )).values(last_activity_at=latest_transfer))
+
+
+@event.listens_for(Account, 'after_insert')
+def account_created(mapper, connection, target):
+    apply_changes(connection, {(target.user_id, target.currency): target.balance}, {target.user_id: 1})
+
+
+@event.listens_for(Account, 'before_delete')
+def account_deleted(mapper, connection, target):
+    # Transfers update balances without refreshing loaded accounts, so read the stored one
+    balance = connection.scalar(select(Account.balance).where(Account.id == target.id))
+    apply_changes(connection, {(target.user_id, target.currency): -balance}, {target.user_id: -1})
+
+    # The delete cascades to the transfers into this account, which are in the
+    # /transactions of the users who sent them, so their data changes too. The cascade
+    # loaded them when the account was marked deleted, and may have deleted them already.
+    senders = {transaction.from_account_id for transaction in target.transactions_to} - {target.id}
+    if senders:
+        users = connection.scalars(select(Account.user_id).where(Account.id.in_(senders)).distinct()).all()
+        touch(connection, set(users) - {target.user_id})
+
+
+@event.listens_for(Account, 'after_delete')
+def account_removed(mapper, connection, target):
+    # Drop the currency from the summary once the user has no account left in it
+    remaining = select(Account.id).where(Account.user_id == target.user_id, Account.currency == target.currency)
+    connection.execute(delete(balances).where(
+        balances.c.user_id == target.user_id, balances.c.currency == target.currency, ~remaining.exists()
+    ))
+
+
+@event.listens_for(Account, 'after_update')
+def account_updated(mapper, connection, target):
+    # Move the balance if an account changes owner, currency or balance through the ORM
+    state = inspect(target)
+    history = {key: state.attrs[key].history for key in ('user_id', 'currency', 'balance')}
+    if not any(change.has_changes() for change in history.values()):
+        touch(connection, [target.user_id])
+        return
+    old = {key: change.deleted[0] if change.deleted else getattr(target, key) for key, change in history.items()}
+    changes = {(old['user_id'], old['currency']): -to_money(old['balance'])}
+    key = (target.user_id, target.currency)
+    changes[key] = changes.get(key, 0) + to_money(target.balance)
+    accounts = {old['user_id']: -1, target.user_id: 1} if old['user_id'] != target.user_id else {}
+    apply_changes(connection, changes, accounts)
+
+
+@event.listens_for(User, 'after_update')
+def user_updated(mapper, connection, target):
+    # Only the fields shown in the user portal; logins also update the user row
+    state = inspect(target)
+    if any(state.attrs[key].history.has_changes() for key in PORTAL_USER_FIELDS):
+        touch(connection, [target.id])
+
+
+@event.listens_for(User, 'before_delete')
+def user_deleted(mapper, connection, target):
+    connection.execute(delete(balances).where(balances.c.user_id == target.id))
+    connection.execute(delete(summaries).where(summaries.c.user_id == target.id))
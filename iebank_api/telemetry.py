@@ -0,0 +1,88 @@
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import logging
+import queue
+import random
+import threading
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Hands records to a bounded queue without ever blocking the request thread.
+    # When the exporter falls behind and the queue is full the record is dropped
+    # and counted instead.
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Leave message formatting to the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class TelemetryListener(QueueListener):
+
+    def stop(self):
+        # Safe to call more than once (explicitly and again at exit)
+        if self._thread is not None:
+            super().stop()
+
+    def abandon(self):
+        # Forget a thread that did not survive fork() so stop() has nothing to wait for
+        self._thread = None
+
+    def enqueue_sentinel(self):
+        # The queue may be full at shutdown; the listener keeps draining it, so wait
+        # for room instead of raising
+        self.queue.put(self._sentinel)
+
+
+def start_telemetry(app, *handlers):
+    # Route app.logger through a bounded queue drained by a background thread that
+    # feeds the (possibly slow) exporter handlers
+    records = queue.Queue(maxsize=app.config.get('TELEMETRY_QUEUE_SIZE', 10000))
+    queue_handler = DroppingQueueHandler(records)
+    listener = TelemetryListener(records, *handlers, respect_handler_level=True)
+
+    app.logger.addHandler(queue_handler)
+    app.logger.setLevel(logging.INFO)
+    listener.start()
+    atexit.register(listener.stop)
+    app.extensions['telemetry'] = queue_handler
+    app.extensions['telemetry_listener'] = listener
+    return listener
+
+
+def detach_telemetry(app):
+    # Remove the pipeline a forked worker inherited from its parent; its listener and
+    # exporter threads only exist in the parent, so the worker must start its own
+    handler = app.extensions.pop('telemetry', None)
+    listener = app.extensions.pop('telemetry_listener', None)
+    if handler:
+        app.logger.removeHandler(handler)
+    if listener:
+        listener.abandon()
+    return handler is not None
+
+
+def dropped_records(app):
+    handler = app.extensions.get('telemetry')
+    return handler.dropped if handler else 0
+
+
+def sampled(app, endpoint, status_code):
+    # Whether to record a request; failures are always kept, successful requests on
+    # high-volume endpoints are sampled at their configured rate
+    if status_code >= 400:
+        return True
+    rates = app.config.get('TELEMETRY_SAMPLE_RATES', {})
+    rate = rates.get(endpoint, app.config.get('TELEMETRY_DEFAULT_SAMPLE_RATE', 1.0))
+    return rate >= 1.0 or random.random() < rate
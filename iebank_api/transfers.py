@@ -0,0 +1,193 @@
+from iebank_api import db
+from iebank_api.models import Account, Transaction
+from iebank_api.fx import exchange_rates
+from iebank_api.money import to_money
+from iebank_api.summaries import apply_changes
+from decimal import Decimal
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+class TransferError(Exception):
+    # Raised when a transfer cannot be applied; the message is safe to return to the client
+    pass
+
+
+BATCH_ITEM_FIELDS = ['from_account_number', 'to_account_number', 'amount', 'currency']
+
+
+class ConcurrentUpdateError(TransferError):
+    # Raised when a balance changed under a batch that had already been validated
+    pass
+
+
+def parse_amount(value):
+    # Validate a transfer amount from the API and turn it into money
+    try:
+        amount = to_money(value)
+    except ValueError:
+        raise TransferError('Invalid amount')
+    if amount <= 0:
+        raise TransferError('Invalid amount')
+    return amount
+
+
+def parse_currency(value):
+    # Validate a transfer currency from the API: a three-letter code
+    if not isinstance(value, str) or len(value) != 3 or not value.isascii() or not value.isalpha():
+        raise TransferError('Invalid currency')
+    return value
+
+
+def convert(amount, from_currency, to_currency):
+    # Convert an amount using the cached conversion matrix, rounding to whole cents
+    if from_currency == to_currency:
+        return amount
+    rate = exchange_rates.rate(from_currency, to_currency)
+    if rate is None:
+        raise TransferError('Unsupported currency conversion!')
+    return to_money(amount * Decimal(repr(rate)))
+
+
+def apply_transfer(from_account, to_account, debit_amount, credit_amount, amount, currency):
+    # Move money between two accounts in the current database transaction.
+    # Balances are never read into Python: the debit is a conditional UPDATE that only
+    # matches while the balance covers it, so concurrent transfers cannot lose updates
+    # or overdraw an account. Rows are updated in id order so two opposite transfers
+    # lock them in the same order and cannot deadlock.
+    updates = [
+        (from_account.id, Account.balance - debit_amount, Account.balance >= debit_amount),
+        (to_account.id, Account.balance + credit_amount, None)
+    ]
+    if from_account.id == to_account.id:
+        # Both legs hit the same row, apply them as a single statement
+        updates = [(from_account.id, Account.balance - debit_amount + credit_amount, Account.balance >= debit_amount)]
+    for account_id, balance, condition in sorted(updates, key=lambda update: update[0]):
+        statement = db.update(Account).where(Account.id == account_id).values(balance=balance)
+        if condition is not None:
+            statement = statement.where(condition)
+        result = db.session.execute(statement.execution_options(synchronize_session=False))
+        if result.rowcount != 1:
+            raise TransferError('Insufficient funds!')
+
+    # Keep both users' portal summaries in step with the balances
+    changes = {(from_account.user_id, from_account.currency): -debit_amount}
+    key = (to_account.user_id, to_account.currency)
+    changes[key] = changes.get(key, 0) + credit_amount
+    apply_changes(db.session.connection(), changes)
+
+    transaction = Transaction(from_account_id=from_account.id, to_account_id=to_account.id, amount=amount, currency=currency)
+    db.session.add(transaction)
+    return transaction
+
+
+def transfer(from_account, to_account, debit_amount, credit_amount, amount, currency):
+    # Apply a single transfer and commit it, rolling back every leg on failure
+    try:
+        transaction = apply_transfer(from_account, to_account, debit_amount, credit_amount, amount, currency)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return transaction
+
+
+def transfer_batch(user_id, items, atomic):
+    # Validate and apply many transfers with one account lookup, one conditional UPDATE
+    # per touched account and one bulk INSERT, leaving the commit to the caller.
+    # Returns the per-item results and whether anything was applied.
+    numbers = set()
+    for item in items:
+        if isinstance(item, dict):
+            numbers.update(str(item.get(field)) for field in ('from_account_number', 'to_account_number'))
+
+    # Lock the involved accounts in id order (FOR UPDATE is a no-op on SQLite, where
+    # the conditional UPDATEs below still guard against concurrent writers)
+    accounts = db.session.scalars(
+        db.select(Account).where(Account.account_number.in_(numbers)).order_by(Account.id).with_for_update()
+    ).all()
+    by_number = {account.account_number: account for account in accounts}
+    balances = {account.id: account.balance for account in accounts}
+    initial = dict(balances)
+
+    results = []
+    rows = []
+    legs = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict) or not all(field in item for field in BATCH_ITEM_FIELDS):
+                raise TransferError('Missing required fields')
+            from_account = by_number.get(str(item['from_account_number']))
+            to_account = by_number.get(str(item['to_account_number']))
+            if not from_account or from_account.user_id != user_id or not to_account:
+                raise TransferError('Invalid account details')
+            amount = parse_amount(item['amount'])
+            currency = parse_currency(item['currency'])
+            debit_amount = convert(amount, currency, from_account.currency)
+            credit_amount = convert(amount, currency, to_account.currency)
+            if balances[from_account.id] < debit_amount:
+                raise TransferError('Insufficient funds!')
+        except TransferError as e:
+            results.append({'index': index, 'status': 'failed', 'message': str(e)})
+            continue
+
+        # Items are applied in order, so later items see the balances left by earlier ones
+        balances[from_account.id] -= debit_amount
+        balances[to_account.id] += credit_amount
+        results.append({'index': index, 'status': 'succeeded'})
+        legs.append((from_account, to_account))
+        rows.append({
+            'from_account_id': from_account.id,
+            'to_account_id': to_account.id,
+            'amount': amount,
+            'currency': currency
+        })
+
+    failed = any(result['status'] == 'failed' for result in results)
+    if not rows or (atomic and failed):
+        db.session.rollback()
+        if atomic:
+            for result in results:
+                if result['status'] == 'succeeded':
+                    result.update(status='skipped', message='Batch rolled back')
+        return results, False
+
+    try:
+        for account_id in sorted(balances):
+            delta = balances[account_id] - initial[account_id]
+            if delta == 0:
+                continue
+            statement = db.update(Account).where(Account.id == account_id).values(balance=Account.balance + delta)
+            if delta < 0:
+                statement = statement.where(Account.balance + delta >= 0)
+            result = db.session.execute(statement.execution_options(synchronize_session=False))
+            if result.rowcount != 1:
+                raise ConcurrentUpdateError('Account balance changed during the batch, please retry')
+
+        changes = {}
+        for account in accounts:
+            key = (account.user_id, account.currency)
+            changes[key] = changes.get(key, 0) + balances[account.id] - initial[account.id]
+        # Every user with a transfer in the batch gets a new data version, even at a net zero
+        users = {account.user_id for leg in legs for account in leg}
+        apply_changes(db.session.connection(), {key: delta for key, delta in changes.items() if delta != 0},
+                      dict.fromkeys(users, 0))
+
+        # Batched into multi-row INSERT ... RETURNING on PostgreSQL; SQLite cannot guarantee
+        # the RETURNING order, so there SQLAlchemy runs one INSERT per row
+        transactions = db.session.scalars(
+            db.insert(Transaction).returning(Transaction, sort_by_parameter_order=True), rows
+        ).all()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # Attach the already loaded accounts so formatting the results needs no queries
+    for transaction, (from_account, to_account) in zip(transactions, legs):
+        set_committed_value(transaction, 'from_account', from_account)
+        set_committed_value(transaction, 'to_account', to_account)
+
+    succeeded = iter(transactions)
+    for result in results:
+        if result['status'] == 'succeeded':
+            result['transaction'] = next(succeeded)
+    return results, True
@@ -0,0 +1,25 @@
+"""Add token_version to User model
+
+Revision ID: 3f1b6a2c9d47
+Revises: c46e6dc8d1ce
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1b6a2c9d47'
+down_revision = 'c46e6dc8d1ce'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('token_version')
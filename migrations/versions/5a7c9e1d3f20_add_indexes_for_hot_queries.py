@@ -0,0 +1,40 @@
+"""Add indexes for the portal, listing and transfer queries
+
+Revision ID: 5a7c9e1d3f20
+Revises: 8d2e4f7a1b93
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7c9e1d3f20'
+down_revision = '8d2e4f7a1b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('account', schema=None) as batch_op:
+        batch_op.create_index('ix_account_user_id_created_at', ['user_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_created_at', ['created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.create_index('ix_transaction_from_account_id_created_at', ['from_account_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_transaction_created_at', ['created_at', 'id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_transaction_to_account_id'), ['to_account_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_transaction_to_account_id'))
+        batch_op.drop_index('ix_transaction_created_at')
+        batch_op.drop_index('ix_transaction_from_account_id_created_at')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_created_at')
+
+    with op.batch_alter_table('account', schema=None) as batch_op:
+        batch_op.drop_index('ix_account_user_id_created_at')
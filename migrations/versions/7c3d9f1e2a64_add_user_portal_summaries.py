@@ -0,0 +1,49 @@
+"""Add maintained user portal summaries
+
+Revision ID: 7c3d9f1e2a64
+Revises: b6f0d2a8c415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3d9f1e2a64'
+down_revision = 'b6f0d2a8c415'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_summary',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('account_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('last_activity_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table('user_balance',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('currency', sa.String(length=3), nullable=False),
+        sa.Column('total', sa.BigInteger(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'currency')
+    )
+
+    # Backfill from the existing accounts and transactions
+    op.execute('INSERT INTO user_balance (user_id, currency, total) '
+               'SELECT user_id, currency, SUM(balance) FROM account GROUP BY user_id, currency')
+    op.execute('INSERT INTO user_summary (user_id, account_count, last_activity_at) '
+               'SELECT "user".id, COUNT(account.id), MAX(account.created_at) '
+               'FROM "user" LEFT OUTER JOIN account ON account.user_id = "user".id GROUP BY "user".id')
+    latest_transfer = ('(SELECT MAX(t.created_at) FROM "transaction" t JOIN account a '
+                       'ON a.id = t.from_account_id OR a.id = t.to_account_id '
+                       'WHERE a.user_id = user_summary.user_id)')
+    op.execute(f'UPDATE user_summary SET last_activity_at = {latest_transfer} '
+               f'WHERE {latest_transfer} > last_activity_at OR ({latest_transfer} IS NOT NULL AND last_activity_at IS NULL)')
+
+
+def downgrade():
+    op.drop_table('user_balance')
+    op.drop_table('user_summary')
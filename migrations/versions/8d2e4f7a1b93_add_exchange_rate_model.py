@@ -0,0 +1,36 @@
+"""Add ExchangeRate model
+
+Revision ID: 8d2e4f7a1b93
+Revises: 3f1b6a2c9d47
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e4f7a1b93'
+down_revision = '3f1b6a2c9d47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    exchange_rate = op.create_table('exchange_rate',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('base_currency', sa.String(length=3), nullable=False),
+        sa.Column('quote_currency', sa.String(length=3), nullable=False),
+        sa.Column('rate', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('base_currency', 'quote_currency')
+    )
+    # Seed the rate that used to be hard-coded in create_transaction
+    op.bulk_insert(exchange_rate, [
+        {'base_currency': 'USD', 'quote_currency': 'EUR', 'rate': 0.95, 'updated_at': datetime.utcnow()}
+    ])
+
+
+def downgrade():
+    op.drop_table('exchange_rate')
@@ -0,0 +1,25 @@
+"""Add locked_until to User model
+
+Revision ID: 9f3c5d7e1b28
+Revises: 4b9e2f6c8a17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f3c5d7e1b28'
+down_revision = '4b9e2f6c8a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('locked_until', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('locked_until')
@@ -0,0 +1,56 @@
+"""Store account balances and transaction amounts as integer minor units
+
+Revision ID: b6f0d2a8c415
+Revises: 5a7c9e1d3f20
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f0d2a8c415'
+down_revision = '5a7c9e1d3f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite rebuilds the table and keeps the stored values, so scale them first
+        op.execute('UPDATE account SET balance = ROUND(balance * 100)')
+        op.execute('UPDATE "transaction" SET amount = ROUND(amount * 100)')
+
+    with op.batch_alter_table('account', schema=None) as batch_op:
+        batch_op.alter_column('balance',
+               existing_type=sa.Float(),
+               type_=sa.BigInteger(),
+               existing_nullable=False,
+               postgresql_using='ROUND(balance * 100)::bigint')
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.alter_column('amount',
+               existing_type=sa.Float(),
+               type_=sa.BigInteger(),
+               existing_nullable=False,
+               postgresql_using='ROUND(amount * 100)::bigint')
+
+
+def downgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.alter_column('amount',
+               existing_type=sa.BigInteger(),
+               type_=sa.Float(),
+               existing_nullable=False,
+               postgresql_using='amount / 100.0')
+
+    with op.batch_alter_table('account', schema=None) as batch_op:
+        batch_op.alter_column('balance',
+               existing_type=sa.BigInteger(),
+               type_=sa.Float(),
+               existing_nullable=False,
+               postgresql_using='balance / 100.0')
+
+    if op.get_bind().dialect.name != 'postgresql':
+        op.execute('UPDATE account SET balance = balance / 100.0')
+        op.execute('UPDATE "transaction" SET amount = amount / 100.0')
@@ -0,0 +1,25 @@
+"""Add data_version to UserSummary model
+
+Revision ID: e1a4c8b2d753
+Revises: 7c3d9f1e2a64
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1a4c8b2d753'
+down_revision = '7c3d9f1e2a64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_summary', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user_summary', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
@@ -1,16 +1,21 @@
 import pytest
-from iebank_api import db, app
+from iebank_api import db, create_app
 from datetime import datetime
 from iebank_api.models import Account, Transaction, User
 from werkzeug.security import generate_password_hash
 
 @pytest.fixture(scope="function")
-def test_app():
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['TESTING'] = True
-    app.config['SECRET_KEY'] = 'test_secret_key'
+def test_app(tmp_path):
+    # A file database so that requests made from other threads share the same data
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'TESTING': True,
+        'SECRET_KEY': 'test_secret_key',
+        'QUERY_BUDGET_ENFORCE': True
+    })
     with app.app_context():
         yield app
+        db.engine.dispose()
 
 @pytest.fixture(scope="function")
 def test_client(test_app):
@@ -21,7 +26,15 @@ def init_database(test_app):
     with test_app.app_context():
         # Import models here to ensure they are registered before creating the tables
         from iebank_api.models import User, Account, Transaction
+        from iebank_api.auth import token_versions
+        from iebank_api.fx import exchange_rates
+        from iebank_api.metrics import registry
+        from iebank_api.rate_limit import login_limiter
         db.create_all()
+        token_versions.clear()
+        login_limiter.reset()
+        exchange_rates.invalidate()
+        registry.reset()
         yield db
         db.session.remove()
         db.drop_all()
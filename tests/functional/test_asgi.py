@@ -0,0 +1,103 @@
+import asyncio
+import json
+import pytest
+from iebank_api.asgi import AsyncAPI
+from iebank_api.models import Account, Transaction
+from iebank_api import db
+
+
+def asgi_request(api, method, path, query_string=b'', headers=(), body=b''):
+    # Run one HTTP request through the ASGI app and collect the response
+    async def run():
+        messages = []
+        received = False
+
+        async def receive():
+            nonlocal received
+            if received:
+                return {'type': 'http.disconnect'}
+            received = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+            'query_string': query_string, 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+            'headers': [(name.encode(), value.encode()) for name, value in headers]
+        }
+        try:
+            await api(scope, receive, send)
+        finally:
+            await api.engine.dispose()
+        start = next(message for message in messages if message['type'] == 'http.response.start')
+        content = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+        return start['status'], dict(start['headers']), content
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def asgi_app(test_app):
+    return AsyncAPI(test_app)
+
+
+def test_async_reads_match_sync_views(test_client, init_database, sample_user, asgi_app):
+    """Test that the async endpoints return the same data as the Flask views."""
+    response = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'})
+    token = response.get_json()['token']
+
+    accounts = [Account(name=f'Account {i}', balance=100.0, currency='USD', country='Spain', user_id=sample_user.id) for i in range(3)]
+    db.session.add_all(accounts)
+    db.session.commit()
+    db.session.add(Transaction(from_account_id=accounts[0].id, to_account_id=accounts[1].id, amount=10.0, currency='USD'))
+    db.session.commit()
+
+    for path, query_string in (('/accounts', b'limit=2'), ('/transactions', b''), ('/user_portal', b'')):
+        status, headers, content = asgi_request(asgi_app, 'GET', path, query_string, [('x-access-token', token)])
+        expected = test_client.get(f'{path}?{query_string.decode()}', headers={'x-access-token': token})
+        assert status == 200
+        assert json.loads(content) == expected.get_json()
+        assert headers[b'content-type'] == b'application/json'
+        assert int(headers[b'x-db-query-count']) >= 1
+
+    assert json.loads(asgi_request(asgi_app, 'GET', '/accounts', b'limit=2', [('x-access-token', token)])[2])['next_cursor']
+
+
+def test_async_errors_and_fallback(test_client, init_database, sample_user, asgi_app):
+    """Test token and argument errors on the async endpoints and the Flask fallback."""
+    status, _, content = asgi_request(asgi_app, 'GET', '/accounts')
+    assert status == 401
+    assert json.loads(content) == {'message': 'Token is missing!'}
+
+    status, _, content = asgi_request(asgi_app, 'GET', '/accounts', headers=[('x-access-token', 'garbage')])
+    assert status == 401
+    assert json.loads(content) == {'message': 'Token is invalid!'}
+
+    # Writes and login are served by the Flask app
+    body = json.dumps({'username': 'testuser', 'password': 'test1234'}).encode()
+    status, _, content = asgi_request(asgi_app, 'POST', '/login', headers=[('content-type', 'application/json'), ('content-length', str(len(body)))], body=body)
+    assert status == 200
+    token = json.loads(content)['token']
+
+    status, _, _ = asgi_request(asgi_app, 'GET', '/accounts', b'limit=0', [('x-access-token', token)])
+    assert status == 400
+
+
+def test_async_conditional_get(test_client, init_database, sample_user, asgi_app):
+    """Test that the async endpoints send the same ETags and answer If-None-Match with 304."""
+    token = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'}).get_json()['token']
+    db.session.add(Account(name='Main', currency='USD', country='Spain', user_id=sample_user.id))
+    db.session.commit()
+
+    etag = test_client.get('/user_portal', headers={'x-access-token': token}).headers['ETag']
+    status, headers, content = asgi_request(asgi_app, 'GET', '/user_portal', headers=[('x-access-token', token)])
+    assert status == 200
+    assert headers[b'etag'].decode() == etag
+
+    status, headers, content = asgi_request(asgi_app, 'GET', '/user_portal', headers=[('x-access-token', token), ('if-none-match', etag)])
+    assert status == 304
+    assert content == b''
+    assert headers[b'x-db-query-count'] == b'1'
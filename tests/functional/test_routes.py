@@ -2,7 +2,7 @@ import pytest
 from datetime import datetime
 from iebank_api.models import User, Account, Transaction
 import json
-from iebank_api import db
+from iebank_api import create_app, db
 from werkzeug.security import generate_password_hash
 
 
@@ -64,14 +64,15 @@ def test_user_portal(test_client, init_database, sample_user):
     response = test_client.get('/user_portal', headers={'x-access-token': token})
     assert response.status_code == 200
     data = response.get_json()
-    assert 'accounts' in data
+    assert 'summary' in data
     assert 'transactions' in data
-    assert len(data['accounts']) == 2
+    assert data['summary']['account_count'] == 2
+    assert data['summary']['balances'] == {'USD': 3000.0}
+    assert data['summary']['last_activity_at'] is not None
     assert len(data['transactions']) == 2
-    assert data['accounts'][0]['name'] == 'Account 1'
-    assert data['accounts'][1]['name'] == 'Account 2'
-    assert data['transactions'][0]['amount'] == 100.0
-    assert data['transactions'][1]['amount'] == 200.0
+    # Most recent first
+    assert data['transactions'][0]['amount'] == 200.0
+    assert data['transactions'][1]['amount'] == 100.0
 
 
 def test_admin_portal(test_client, init_database, admin_user):
@@ -347,4 +348,942 @@ def test_delete_user(test_client, init_database, admin_user):
     assert response.status_code == 200
     data = response.get_json()
     assert data['username'] == 'deleteuser'
-    assert data['email'] == 'deleteuser@example.com'
\ No newline at end of file
+    assert data['email'] == 'deleteuser@example.com'
+
+def test_transactions_query_count_is_constant(test_client, init_database, sample_user):
+    """Test that listing transactions does not issue extra queries per row."""
+    from sqlalchemy import event
+
+    # Log in the user first
+    response = test_client.post('/login', json={
+        'username': 'testuser',
+        'password': 'test1234'
+    })
+    assert response.status_code == 200
+    token = response.get_json()['token']
+
+    account = Account(name='Account 1', balance=1000.0, currency='USD', country='Spain', user_id=sample_user.id)
+    db.session.add(account)
+    db.session.commit()
+    user_id, account_id, account_number = sample_user.id, account.id, account.account_number
+
+    statements = []
+
+    def count_queries(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def query_count(path):
+        # Start from an empty identity map so lazy loads would hit the database
+        db.session.expunge_all()
+        statements.clear()
+        event.listen(db.engine, 'before_cursor_execute', count_queries)
+        try:
+            response = test_client.get(path, headers={'x-access-token': token})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_queries)
+        assert response.status_code == 200
+        return len(statements), response.get_json()
+
+    def add_transactions(count):
+        # Every transaction goes to a different account
+        for i in range(count):
+            to_account = Account(name=f'Payee {i}', currency='EUR', country='Spain', user_id=user_id)
+            db.session.add(to_account)
+            db.session.flush()
+            db.session.add(Transaction(from_account_id=account_id, to_account_id=to_account.id, amount=1.0, currency='USD'))
+        db.session.commit()
+
+    # Warm up the token version cache so only the listing queries are counted
+    query_count('/accounts')
+
+    add_transactions(2)
+    small_count, small_data = query_count('/transactions')
+    add_transactions(20)
+    large_count, large_data = query_count('/transactions')
+
+    assert len(large_data['transactions']) == len(small_data['transactions']) + 20
+    assert large_count == small_count
+    assert large_data['transactions'][-1]['from_account'] == account_number
+    assert large_data['transactions'][-1]['currency'] == 'USD'
+
+    # The portal renders its summary row and a bounded number of recent transactions
+    small_count, small_data = query_count('/user_portal')
+    add_transactions(20)
+    large_count, large_data = query_count('/user_portal')
+    assert large_count == small_count
+    assert len(large_data['transactions']) == len(small_data['transactions']) == 10
+    assert large_data['summary']['account_count'] == 43
+
+
+def test_get_accounts_pagination(test_client, init_database, sample_user):
+    """Test walking the accounts of a user page by page."""
+    # Log in the user first
+    response = test_client.post('/login', json={
+        'username': 'testuser',
+        'password': 'test1234'
+    })
+    assert response.status_code == 200
+    token = response.get_json()['token']
+
+    for i in range(5):
+        db.session.add(Account(name=f'Account {i}', currency='USD', country='Spain', user_id=sample_user.id))
+    db.session.commit()
+
+    names = []
+    cursor = None
+    pages = 0
+    while True:
+        query = {'limit': 2}
+        if cursor:
+            query['cursor'] = cursor
+        response = test_client.get('/accounts', query_string=query, headers={'x-access-token': token})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert len(data['accounts']) <= 2
+        names += [account['name'] for account in data['accounts']]
+        pages += 1
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    assert pages == 3
+    assert names == [f'Account {i}' for i in range(5)]
+
+    # Malformed cursors and limits are rejected
+    response = test_client.get('/accounts', query_string={'cursor': 'not-a-cursor'}, headers={'x-access-token': token})
+    assert response.status_code == 400
+    response = test_client.get('/accounts', query_string={'limit': 0}, headers={'x-access-token': token})
+    assert response.status_code == 400
+
+
+def test_export_transactions(test_client, init_database, admin_user):
+    """Test streaming the transactions export as NDJSON and CSV."""
+    # Log in the admin user first
+    response = test_client.post('/login', json={
+        'username': 'admin',
+        'password': 'adminpass'
+    })
+    assert response.status_code == 200
+    token = response.get_json()['token']
+
+    account1 = Account(name='Account 1', balance=1000.0, currency='USD', country='Spain', user_id=admin_user.id)
+    account2 = Account(name='Account 2', balance=2000.0, currency='USD', country='Spain', user_id=admin_user.id)
+    db.session.add(account1)
+    db.session.add(account2)
+    db.session.commit()
+
+    db.session.add(Transaction(from_account_id=account1.id, to_account_id=account2.id, amount=100.0, currency='USD'))
+    db.session.add(Transaction(from_account_id=account2.id, to_account_id=account1.id, amount=200.0, currency='USD'))
+    db.session.commit()
+
+    response = test_client.get('/admin/transactions/export', headers={'x-access-token': token})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row['amount'] for row in rows] == [100.0, 200.0]
+    assert rows[0]['from_account'] == account1.account_number
+    assert rows[0]['to_account'] == account2.account_number
+
+    response = test_client.get('/admin/transactions/export', query_string={'format': 'csv'}, headers={'x-access-token': token})
+    assert response.status_code == 200
+    lines = response.data.decode().splitlines()
+    assert lines[0] == 'id,from_account,to_account,amount,currency,status,created_at'
+    assert len(lines) == 3
+
+    response = test_client.get('/admin/transactions/export', query_string={'since': '2999-01-01'}, headers={'x-access-token': token})
+    assert response.status_code == 200
+    assert response.data == b''
+
+    response = test_client.get('/admin/transactions/export', query_string={'since': 'yesterday'}, headers={'x-access-token': token})
+    assert response.status_code == 400
+
+    # Timestamps with an offset are compared in UTC, like the stored created_at
+    first, second = Transaction.query.order_by(Transaction.id).all()
+    first.created_at = datetime(2024, 1, 1, 10, 0)
+    second.created_at = datetime(2024, 1, 1, 12, 0)
+    db.session.commit()
+    response = test_client.get('/admin/transactions/export', query_string={
+        'since': '2024-01-01T12:30:00+02:00', 'until': '2024-01-01T12:30:00Z'
+    }, headers={'x-access-token': token})
+    assert [json.loads(line)['id'] for line in response.data.decode().splitlines()] == [second.id]
+
+
+def test_token_required_skips_user_lookup(test_client, init_database, sample_user):
+    """Test that authenticated requests are authorized from the token claims."""
+    from sqlalchemy import event
+
+    response = test_client.post('/login', json={
+        'username': 'testuser',
+        'password': 'test1234'
+    })
+    assert response.status_code == 200
+    token = response.get_json()['token']
+
+    statements = []
+
+    def count_queries(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # The first request caches the token version, later ones only run the ETag version
+    # lookup and the route query
+    test_client.get('/accounts', headers={'x-access-token': token})
+    event.listen(db.engine, 'before_cursor_execute', count_queries)
+    try:
+        response = test_client.get('/accounts', headers={'x-access-token': token})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_queries)
+    assert response.status_code == 200
+    assert len(statements) == 2
+    assert 'user_summary.data_version' in statements[0]
+    assert not any('token_version' in statement for statement in statements)
+
+
+def test_update_user_revokes_tokens(test_client, init_database, admin_user):
+    """Test that tokens issued before an admin update or delete are rejected."""
+    user = User(
+        username='revokeduser',
+        email='revokeduser@example.com',
+        password=generate_password_hash('password123'),
+        country='USA',
+        date_of_birth=datetime.strptime('1990-01-01', '%Y-%m-%d')
+    )
+    db.session.add(user)
+    db.session.commit()
+
+    response = test_client.post('/login', json={'username': 'admin', 'password': 'adminpass'})
+    admin_token = response.get_json()['token']
+    response = test_client.post('/login', json={'username': 'revokeduser', 'password': 'password123'})
+    user_token = response.get_json()['token']
+    assert test_client.get('/accounts', headers={'x-access-token': user_token}).status_code == 200
+
+    response = test_client.put(f'/admin/users/{user.id}', json={
+        'username': 'revokeduser',
+        'email': 'revokeduser@example.com',
+        'country': 'USA',
+        'date_of_birth': '1990-01-01',
+        'role': 'user',
+        'status': 'blocked'
+    }, headers={'x-access-token': admin_token})
+    assert response.status_code == 200
+
+    response = test_client.get('/accounts', headers={'x-access-token': user_token})
+    assert response.status_code == 401
+    assert response.get_json()['message'] == 'Token has been revoked!'
+
+    # A fresh login carries the new status and version
+    response = test_client.post('/login', json={'username': 'revokeduser', 'password': 'password123'})
+    user_token = response.get_json()['token']
+    assert test_client.get('/accounts', headers={'x-access-token': user_token}).status_code == 200
+
+    response = test_client.delete(f'/admin/users/{user.id}', headers={'x-access-token': admin_token})
+    assert response.status_code == 200
+    response = test_client.get('/accounts', headers={'x-access-token': user_token})
+    assert response.status_code == 401
+
+
+def test_token_versions_evicted_users_are_read_again(test_client, init_database, admin_user, sample_user):
+    """Test that the token version map stays bounded and re-reads evicted users directly."""
+    from iebank_api.auth import token_versions
+    from sqlalchemy import event, update
+
+    config = test_client.application.config
+    config['TOKEN_VERSION_MAX_USERS'] = 1
+    config['TOKEN_VERSION_QUERY_CHUNK'] = 1
+    admin_token = test_client.post('/login', json={'username': 'admin', 'password': 'adminpass'}).get_json()['token']
+    user_token = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'}).get_json()['token']
+    assert test_client.get('/accounts', headers={'x-access-token': user_token}).status_code == 200
+    assert token_versions.lookup(sample_user.id)[0]
+
+    # The admin's request evicts testuser, whose revocation by another worker is then
+    # seen on the next request without waiting for a refresh
+    assert test_client.get('/admin_portal', headers={'x-access-token': admin_token}).status_code == 200
+    assert token_versions.lookup(sample_user.id) == (False, None)
+    db.session.execute(update(User).where(User.id == sample_user.id).values(token_version=User.token_version + 1))
+    db.session.commit()
+    response = test_client.get('/accounts', headers={'x-access-token': user_token})
+    assert response.status_code == 401
+    assert response.get_json()['message'] == 'Token has been revoked!'
+
+    # Refreshes re-read the tracked users in IN lists of TOKEN_VERSION_QUERY_CHUNK ids
+    config['TOKEN_VERSION_MAX_USERS'] = 10
+    token_versions.remember(admin_user.id, 0)
+    statements = []
+
+    def count_queries(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count_queries)
+    try:
+        token_versions.refresh()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_queries)
+    assert len(statements) == 2
+    assert token_versions.lookup(admin_user.id) == (True, admin_user.token_version)
+
+
+def test_login_rejected_when_hash_pool_saturated(test_client, init_database, sample_user):
+    """Test that /login answers 503 instead of queueing when the hashing pool is full."""
+    from iebank_api import hashing
+
+    config = test_client.application.config
+    saved = {key: config[key] for key in ('PASSWORD_HASH_WORKERS', 'PASSWORD_HASH_QUEUE_DEPTH') if key in config}
+    config['PASSWORD_HASH_WORKERS'] = 1
+    config['PASSWORD_HASH_QUEUE_DEPTH'] = 0
+    hashing.shutdown_pool()
+    try:
+        pool, slots = hashing._get_pool()
+        # Occupy the only slot
+        assert slots.acquire(blocking=False)
+        response = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'})
+        assert response.status_code == 503
+
+        slots.release()
+        response = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'})
+        assert response.status_code == 200
+    finally:
+        hashing.shutdown_pool()
+        config.pop('PASSWORD_HASH_WORKERS')
+        config.pop('PASSWORD_HASH_QUEUE_DEPTH')
+        config.update(saved)
+
+
+def test_concurrent_transactions_conserve_money(test_client, init_database, sample_user):
+    """Test that concurrent transfers never lose updates or overdraw an account."""
+    import random
+    import threading
+
+    response = test_client.post('/login', json={
+        'username': 'testuser',
+        'password': 'test1234'
+    })
+    assert response.status_code == 200
+    token = response.get_json()['token']
+
+    accounts = [Account(name=f'Account {i}', balance=100.0, currency='USD', country='Spain', user_id=sample_user.id) for i in range(3)]
+    db.session.add_all(accounts)
+    db.session.commit()
+    account_ids = [account.id for account in accounts]
+    account_numbers = [account.account_number for account in accounts]
+
+    statuses = []
+    errors = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = test_client.application.test_client()
+        try:
+            for _ in range(25):
+                from_number, to_number = rng.sample(account_numbers, 2)
+                response = client.post('/transactions', json={
+                    'from_account_number': from_number,
+                    'to_account_number': to_number,
+                    'amount': 30.0,
+                    'currency': 'USD'
+                }, headers={'x-access-token': token})
+                statuses.append(response.status_code)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert set(statuses) <= {200, 400}
+    db.session.expire_all()
+    balances = [db.session.get(Account, account_id).balance for account_id in account_ids]
+    assert sum(balances) == 300.0
+    assert min(balances) >= 0
+    assert Transaction.query.count() == statuses.count(200)
+
+
+def test_create_transactions_batch(test_client, init_database, sample_user):
+    """Test applying a batch of transfers in atomic and best-effort mode."""
+    response = test_client.post('/login', json={
+        'username': 'testuser',
+        'password': 'test1234'
+    })
+    assert response.status_code == 200
+    token = response.get_json()['token']
+
+    account1 = Account(name='Account 1', balance=100.0, currency='USD', country='Spain', user_id=sample_user.id)
+    account2 = Account(name='Account 2', balance=0.0, currency='USD', country='Spain', user_id=sample_user.id)
+    db.session.add_all([account1, account2])
+    db.session.commit()
+    account1_id, account2_id = account1.id, account2.id
+    number1, number2 = account1.account_number, account2.account_number
+
+    transfers = [
+        {'from_account_number': number1, 'to_account_number': number2, 'amount': 60.0, 'currency': 'USD'},
+        {'from_account_number': number1, 'to_account_number': number2, 'amount': 60.0, 'currency': 'USD'},
+        {'from_account_number': number2, 'to_account_number': number1, 'amount': 10.0, 'currency': 'USD'},
+        {'from_account_number': 'unknown', 'to_account_number': number1, 'amount': 10.0, 'currency': 'USD'}
+    ]
+
+    # The second transfer overdraws account 1, so the atomic batch is rejected as a whole
+    response = test_client.post('/transactions/batch', json={'transfers': transfers}, headers={'x-access-token': token})
+    assert response.status_code == 400
+    data = response.get_json()
+    assert [result['status'] for result in data['results']] == ['skipped', 'failed', 'skipped', 'failed']
+    assert data['results'][1]['message'] == 'Insufficient funds!'
+    assert Transaction.query.count() == 0
+
+    response = test_client.post('/transactions/batch', json={'transfers': transfers, 'mode': 'best_effort'}, headers={'x-access-token': token})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [result['status'] for result in data['results']] == ['succeeded', 'failed', 'succeeded', 'failed']
+    assert data['succeeded'] == 2
+    assert data['results'][0]['transaction']['from_account'] == number1
+    assert data['results'][2]['transaction']['amount'] == 10.0
+
+    db.session.expire_all()
+    assert db.session.get(Account, account1_id).balance == 50.0
+    assert db.session.get(Account, account2_id).balance == 50.0
+    assert Transaction.query.count() == 2
+
+
+def test_create_transaction_with_exchange_rate(test_client, init_database, sample_user):
+    """Test converting a transfer through a stored exchange rate."""
+    from iebank_api.models import ExchangeRate
+
+    response = test_client.post('/login', json={
+        'username': 'testuser',
+        'password': 'test1234'
+    })
+    assert response.status_code == 200
+    token = response.get_json()['token']
+
+    db.session.add(ExchangeRate(base_currency='EUR', quote_currency='GBP', rate=0.8))
+    account1 = Account(name='Account 1', balance=1000.0, currency='EUR', country='Spain', user_id=sample_user.id)
+    account2 = Account(name='Account 2', balance=0.0, currency='GBP', country='UK', user_id=sample_user.id)
+    db.session.add_all([account1, account2])
+    db.session.commit()
+
+    response = test_client.post('/transactions', json={
+        'from_account_number': account1.account_number,
+        'to_account_number': account2.account_number,
+        'amount': 100.0,
+        'currency': 'EUR'
+    }, headers={'x-access-token': token})
+    assert response.status_code == 200
+    db.session.expire_all()
+    assert account1.balance == 900.0
+    assert account2.balance == pytest.approx(80.0)
+
+    response = test_client.post('/transactions', json={
+        'from_account_number': account1.account_number,
+        'to_account_number': account2.account_number,
+        'amount': 100.0,
+        'currency': 'JPY'
+    }, headers={'x-access-token': token})
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Unsupported currency conversion!'
+
+    # A currency that is not a three-letter string is rejected, alone or in a batch
+    response = test_client.post('/transactions', json={
+        'from_account_number': account1.account_number,
+        'to_account_number': account2.account_number,
+        'amount': 100.0,
+        'currency': ['EUR']
+    }, headers={'x-access-token': token})
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Invalid currency'
+
+    response = test_client.post('/transactions/batch', json={'transfers': [{
+        'from_account_number': account1.account_number,
+        'to_account_number': account2.account_number,
+        'amount': 100.0,
+        'currency': {'code': 'EUR'}
+    }]}, headers={'x-access-token': token})
+    assert response.status_code == 400
+    assert response.get_json()['results'][0]['message'] == 'Invalid currency'
+
+
+def test_reconciliation(test_client, init_database, admin_user):
+    """Test the exact per-currency totals reported to admins."""
+    from iebank_api.models import UserBalance
+
+    response = test_client.post('/login', json={
+        'username': 'admin',
+        'password': 'adminpass'
+    })
+    assert response.status_code == 200
+    token = response.get_json()['token']
+
+    account1 = Account(name='Account 1', balance=0.1, currency='EUR', country='Spain', user_id=admin_user.id)
+    account2 = Account(name='Account 2', balance=0.2, currency='EUR', country='Spain', user_id=admin_user.id)
+    db.session.add_all([account1, account2])
+    db.session.commit()
+
+    response = test_client.post('/transactions', json={
+        'from_account_number': account1.account_number,
+        'to_account_number': account2.account_number,
+        'amount': 0.05,
+        'currency': 'EUR'
+    }, headers={'x-access-token': token})
+    assert response.status_code == 200
+
+    response = test_client.get('/admin/reconciliation', headers={'x-access-token': token})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['balances'] == [{'currency': 'EUR', 'accounts': 2, 'total_balance': 0.3, 'negative_balances': 0}]
+    assert data['transactions'] == [{'currency': 'EUR', 'transactions': 1, 'total_amount': 0.05}]
+    assert data['summary_mismatches'] == []
+    assert data['consistent'] is True
+
+    # A maintained total that drifted from the accounts is reported
+    db.session.execute(db.update(UserBalance).where(UserBalance.user_id == admin_user.id).values(total=5))
+    db.session.commit()
+    data = test_client.get('/admin/reconciliation', headers={'x-access-token': token}).get_json()
+    assert data['summary_mismatches'] == [
+        {'user_id': admin_user.id, 'currency': 'EUR', 'accounts_total': 0.3, 'summary_total': 5.0}
+    ]
+    assert data['consistent'] is False
+
+
+def test_pool_metrics_report(test_client, init_database, admin_user, sample_user):
+    """Test that only admins can read the connection pool metrics."""
+    response = test_client.post('/login', json={'username': 'admin', 'password': 'adminpass'})
+    admin_token = response.get_json()['token']
+    response = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'})
+    user_token = response.get_json()['token']
+
+    response = test_client.get('/admin/metrics/pool', headers={'x-access-token': admin_token})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['pools']['sync']['in_use'] >= 1
+    assert 'checkout_wait' in data['pools']['sync']
+
+    response = test_client.get('/admin/metrics/pool', headers={'x-access-token': user_token})
+    assert response.status_code == 401
+
+
+def test_metrics_endpoint(test_client, init_database, sample_user):
+    """Test that /metrics exposes per-route latency histograms and query counters."""
+    response = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'})
+    token = response.get_json()['token']
+    for _ in range(2):
+        test_client.get('/accounts', headers={'x-access-token': token})
+    test_client.get('/accounts/999999', headers={'x-access-token': token})
+
+    response = test_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    assert 'http_request_duration_seconds_count{route="/accounts",method="GET",status="200"} 2' in lines
+    assert 'http_request_duration_seconds_bucket{route="/accounts",method="GET",status="200",le="+Inf"} 2' in lines
+    assert 'http_request_duration_seconds_count{route="/login",method="POST",status="200"} 1' in lines
+    queries = [line for line in lines if line.startswith('db_queries_total{route="/accounts"}')]
+    assert queries and int(queries[0].split()[-1]) >= 2
+
+    # The scrape can be restricted to a bearer token
+    test_client.application.config['METRICS_TOKEN'] = 'scrape-secret'
+    assert test_client.get('/metrics').status_code == 401
+    response = test_client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+
+
+def test_query_stats_headers_and_budget(test_client, init_database, sample_user, caplog):
+    """Test the per-request query headers, the slow-query log and the endpoint query budget."""
+    from iebank_api.metrics import QueryBudgetExceeded
+    response = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'})
+    token = response.get_json()['token']
+
+    config = test_client.application.config
+    config['SLOW_QUERY_THRESHOLD_MS'] = 0
+    with caplog.at_level('WARNING'):
+        response = test_client.get('/user_portal', headers={'x-access-token': token})
+    assert response.status_code == 200
+    assert int(response.headers['X-DB-Query-Count']) >= 1
+    assert float(response.headers['X-DB-Time-Ms']) >= 0
+    slow = [record for record in caplog.records if record.getMessage().startswith('Slow query')]
+    assert slow and slow[0].custom_dimensions['route'] == '/user_portal'
+
+    config['QUERY_BUDGETS'] = dict(config['QUERY_BUDGETS'], **{'api.user_portal': 0})
+    with pytest.raises(QueryBudgetExceeded):
+        test_client.get('/user_portal', headers={'x-access-token': token})
+
+
+def test_user_summary_follows_account_and_transfer_changes(test_client, init_database, sample_user, admin_user):
+    """Test that the maintained portal summaries match a rebuild from the accounts."""
+    from iebank_api import summaries
+    from iebank_api.models import UserBalance, UserSummary
+
+    def snapshot():
+        db.session.expire_all()
+        return (
+            sorted((s.user_id, s.account_count) for s in UserSummary.query.all()),
+            sorted((b.user_id, b.currency, b.total) for b in UserBalance.query.all())
+        )
+
+    response = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'})
+    token = response.get_json()['token']
+    headers = {'x-access-token': token}
+    numbers = []
+    for currency, balance in (('USD', 100.0), ('USD', 50.0), ('EUR', 10.0)):
+        response = test_client.post('/accounts', json={'name': 'Acc', 'currency': currency, 'balance': balance, 'country': 'Spain'}, headers=headers)
+        numbers.append((response.get_json()['id'], response.get_json()['account_number']))
+    other = Account(name='Other', balance=0, currency='EUR', country='Spain', user_id=admin_user.id)
+    db.session.add(other)
+    db.session.commit()
+    other_number = other.account_number
+
+    test_client.post('/transactions', json={'from_account_number': numbers[0][1], 'to_account_number': numbers[1][1], 'amount': 30, 'currency': 'USD'}, headers=headers)
+    test_client.post('/transactions', json={'from_account_number': numbers[0][1], 'to_account_number': other_number, 'amount': 20, 'currency': 'USD'}, headers=headers)
+    test_client.post('/transactions/batch', json={'transfers': [
+        {'from_account_number': numbers[1][1], 'to_account_number': numbers[2][1], 'amount': 10, 'currency': 'USD'}
+    ]}, headers=headers)
+    test_client.delete(f'/accounts/{numbers[2][0]}', headers=headers)
+
+    maintained = snapshot()
+    response = test_client.get('/user_portal', headers=headers)
+    assert response.get_json()['summary']['account_count'] == 2
+    assert response.get_json()['summary']['balances'] == {'USD': 120.0}
+
+    summaries.rebuild(db.session.connection())
+    db.session.commit()
+    assert snapshot() == maintained
+
+    # Deleting a user removes their summary with them
+    user = User(username='leaving', email='leaving@example.com', password='x', country='Spain', date_of_birth=datetime(1990, 1, 1))
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Account(name='Last', balance=5, currency='USD', country='Spain', user_id=user.id))
+    db.session.commit()
+    user_id = user.id
+    assert UserSummary.query.filter_by(user_id=user_id).count() == 1
+    db.session.delete(user)
+    db.session.commit()
+    assert UserSummary.query.filter_by(user_id=user_id).count() == 0
+    assert UserBalance.query.filter_by(user_id=user_id).count() == 0
+
+
+def test_list_endpoints_select_only_serialized_columns(test_client, init_database, admin_user):
+    """Test that admin_portal and get_accounts read only the columns they return."""
+    from sqlalchemy import event
+
+    response = test_client.post('/login', json={
+        'username': 'admin',
+        'password': 'adminpass'
+    })
+    token = response.get_json()['token']
+    db.session.add(Account(name='Savings', currency='USD', country='Spain', user_id=admin_user.id))
+    db.session.commit()
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        users = test_client.get('/admin_portal', headers={'x-access-token': token}).get_json()['users']
+        accounts = test_client.get('/accounts', headers={'x-access-token': token}).get_json()['accounts']
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert not any('password' in statement for statement in statements)
+    # The WHERE clause filters on account.user_id, but it is not read back
+    assert not any('account.user_id' in statement.split('FROM')[0] for statement in statements)
+    assert set(users[0]) == {'id', 'username', 'email', 'country', 'date_of_birth', 'role', 'status'}
+    assert accounts[0]['name'] == 'Savings'
+    assert accounts[0]['balance'] == 0
+
+
+def test_conditional_get(test_client, init_database, sample_user, admin_user):
+    """Test ETags and 304 responses on the polled read endpoints."""
+    from sqlalchemy import event
+
+    token = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'}).get_json()['token']
+    headers = {'x-access-token': token}
+    admin_token = test_client.post('/login', json={'username': 'admin', 'password': 'adminpass'}).get_json()['token']
+    account = Account(name='Main', balance=100.0, currency='USD', country='Spain', user_id=sample_user.id)
+    other = Account(name='Other', balance=100.0, currency='USD', country='Spain', user_id=admin_user.id)
+    db.session.add_all([account, other])
+    db.session.commit()
+
+    def etags():
+        return {path: test_client.get(path, headers=headers).headers['ETag']
+                for path in ('/user_portal', '/accounts', '/accounts?limit=1', '/transactions')}
+
+    before = etags()
+    assert len(set(before.values())) == 4
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = test_client.get('/user_portal', headers=dict(headers, **{'If-None-Match': before['/user_portal']}))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == before['/user_portal']
+    assert len(statements) == 1
+
+    # Renaming an account, transfers in either direction and profile edits change every ETag
+    test_client.put(f'/accounts/{account.id}', json={'name': 'Renamed'}, headers=headers)
+    renamed = etags()
+    assert not set(renamed.values()) & set(before.values())
+
+    test_client.post('/transactions', json={'from_account_number': other.account_number, 'to_account_number': account.account_number,
+                                            'amount': 1, 'currency': 'USD'}, headers={'x-access-token': admin_token})
+    received = etags()
+    assert not set(received.values()) & set(renamed.values())
+
+    sample_user.email = 'changed@example.com'
+    db.session.commit()
+    response = test_client.get('/user_portal', headers=dict(headers, **{'If-None-Match': received['/user_portal']}))
+    assert response.status_code == 200
+    assert response.get_json()['user']['email'] == 'changed@example.com'
+
+
+def test_compressed_responses(test_client, init_database, sample_user):
+    """Test gzip on a large list, its ETag, and the compression metrics."""
+    import gzip
+
+    token = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'}).get_json()['token']
+    accounts = [Account(name=f'Account {i}', balance=100.0, currency='USD', country='Spain', user_id=sample_user.id) for i in range(30)]
+    db.session.add_all(accounts)
+    db.session.commit()
+
+    plain = test_client.get('/accounts', headers={'x-access-token': token})
+    response = test_client.get('/accounts', headers={'x-access-token': token, 'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(response.data) < len(plain.data) / 4
+    assert json.loads(gzip.decompress(response.data)) == plain.get_json()
+    assert response.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+
+    # The client revalidates with the ETag of the compressed body
+    response = test_client.get('/accounts', headers={'x-access-token': token, 'Accept-Encoding': 'gzip',
+                                                     'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+    metrics = test_client.get('/metrics').get_data(as_text=True)
+    assert f'http_response_bytes_total{{encoding="gzip"}} {len(plain.data)}' in metrics
+
+
+def test_idempotency_key_replays_original_response(test_client, init_database, sample_user):
+    """Test that retries sent with the same Idempotency-Key run the request only once."""
+    from datetime import timedelta
+    from iebank_api.idempotency import purge_expired
+    from iebank_api.models import IdempotencyKey
+
+    token = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'}).get_json()['token']
+    accounts = [Account(name=f'Account {i}', balance=100.0, currency='USD', country='Spain', user_id=sample_user.id) for i in range(2)]
+    db.session.add_all(accounts)
+    db.session.commit()
+    payload = {'from_account_number': accounts[0].account_number, 'to_account_number': accounts[1].account_number,
+               'amount': 10.0, 'currency': 'USD'}
+
+    def post(path, body, key):
+        return test_client.post(path, json=body, headers={'x-access-token': token, 'Idempotency-Key': key})
+
+    first = post('/transactions', payload, 'transfer-1')
+    retry = post('/transactions', payload, 'transfer-1')
+    assert first.status_code == retry.status_code == 200
+    assert retry.get_json() == first.get_json()
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    assert Transaction.query.count() == 1
+
+    # Same key for a different request
+    assert post('/transactions', dict(payload, amount=20.0), 'transfer-1').status_code == 422
+    assert post('/accounts', {'name': 'New', 'currency': 'USD', 'balance': 0, 'country': 'Spain'}, 'transfer-1').status_code == 422
+
+    # A failed transfer is replayed as well, even once it would succeed
+    failed = post('/transactions', dict(payload, amount=500.0), 'transfer-2')
+    assert failed.status_code == 400
+    db.session.execute(db.update(Account).where(Account.id == accounts[0].id).values(balance=100000))
+    db.session.commit()
+    assert post('/transactions', dict(payload, amount=500.0), 'transfer-2').get_json() == failed.get_json()
+
+    account = {'name': 'Savings', 'currency': 'USD', 'balance': 5, 'country': 'Spain'}
+    created = post('/accounts', account, 'account-1')
+    assert post('/accounts', account, 'account-1').get_json() == created.get_json()
+    assert Account.query.filter_by(name='Savings').count() == 1
+    assert post('/accounts', account, 'x' * 65).status_code == 400
+
+    # Expired keys run the request again and are purged
+    db.session.execute(db.update(IdempotencyKey).values(created_at=datetime.utcnow() - timedelta(days=2)))
+    db.session.commit()
+    assert post('/accounts', account, 'account-1').get_json()['id'] != created.get_json()['id']
+    assert purge_expired() == 2
+    assert IdempotencyKey.query.count() == 1
+
+
+def test_idempotency_key_kept_when_view_fails_after_commit(test_client, init_database, sample_user, monkeypatch):
+    """Test that a transfer committed before its view failed is not applied again on retry."""
+    from iebank_api import routes
+
+    token = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'}).get_json()['token']
+    accounts = [Account(name=f'Account {i}', balance=100.0, currency='USD', country='Spain', user_id=sample_user.id) for i in range(2)]
+    db.session.add_all(accounts)
+    db.session.commit()
+    payload = {'from_account_number': accounts[0].account_number, 'to_account_number': accounts[1].account_number,
+               'amount': 10.0, 'currency': 'USD'}
+
+    def post(key):
+        return test_client.post('/transactions', json=payload, headers={'x-access-token': token, 'Idempotency-Key': key})
+
+    # Formatting the response runs after transfer() has committed
+    def fail(transaction):
+        raise RuntimeError('response failed')
+
+    monkeypatch.setattr(routes, 'format_transaction', fail)
+    with pytest.raises(RuntimeError):
+        post('committed')
+    monkeypatch.undo()
+
+    retry = post('committed')
+    assert retry.status_code == 500
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert Transaction.query.count() == 1
+    db.session.expire_all()
+    assert db.session.get(Account, accounts[0].id).balance == 90.0
+
+    # A view that fails before committing leaves the key free for a retry
+    monkeypatch.setattr(routes, 'transfer', lambda *args: fail(None))
+    with pytest.raises(RuntimeError):
+        post('uncommitted')
+    monkeypatch.undo()
+    assert post('uncommitted').status_code == 200
+    assert Transaction.query.count() == 2
+
+
+def test_concurrent_retries_with_idempotency_key(test_client, init_database, sample_user):
+    """Test that concurrent retries of one transfer apply it once."""
+    import threading
+
+    token = test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'}).get_json()['token']
+    accounts = [Account(name=f'Account {i}', balance=100.0, currency='USD', country='Spain', user_id=sample_user.id) for i in range(2)]
+    db.session.add_all(accounts)
+    db.session.commit()
+    payload = {'from_account_number': accounts[0].account_number, 'to_account_number': accounts[1].account_number,
+               'amount': 10.0, 'currency': 'USD'}
+
+    statuses = []
+    errors = []
+
+    def worker():
+        client = test_client.application.test_client()
+        try:
+            for _ in range(5):
+                response = client.post('/transactions', json=payload, headers={'x-access-token': token, 'Idempotency-Key': 'retry'})
+                statuses.append(response.status_code)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert set(statuses) <= {200, 409}
+    assert Transaction.query.count() == 1
+    db.session.expire_all()
+    assert db.session.get(Account, accounts[0].id).balance == 90.0
+
+
+def test_login_rate_limit_and_lockout(test_client, init_database, sample_user, monkeypatch):
+    """Test that throttled logins are rejected unhashed and failures lock the account."""
+    from datetime import timedelta
+    from iebank_api import routes
+    from iebank_api.rate_limit import login_limiter
+
+    hashed = []
+    verify = routes.verify_password
+    monkeypatch.setattr(routes, 'verify_password', lambda *args: hashed.append(1) or verify(*args))
+
+    def login(password, username='testuser', ip='10.0.0.1'):
+        return test_client.post('/login', json={'username': username, 'password': password},
+                                environ_base={'REMOTE_ADDR': ip})
+
+    # Five failures lock the account and use up the username's burst
+    for _ in range(5):
+        assert login('wrong').status_code == 401
+    db.session.refresh(sample_user)
+    assert sample_user.failed_login_attempts == 0
+    assert sample_user.locked_until > datetime.utcnow()
+    assert len(hashed) == 5
+
+    # Throttled, even from another IP: rejected before the lookup and the hash
+    response = login('test1234', ip='10.0.0.2')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+    # Past the limiter, the locked account refuses the right password unhashed too
+    test_client.application.config['LOGIN_RATE_LIMITS'] = {'ip': (30, 60), 'username': (100, 60)}
+    login_limiter.reset()
+    response = login('test1234', ip='10.0.0.3')
+    assert response.status_code == 423
+    assert int(response.headers['Retry-After']) > 0
+    assert len(hashed) == 5
+
+    # Once the lock expires a successful login clears the failure count
+    sample_user.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    sample_user.failed_login_attempts = 2
+    db.session.commit()
+    assert login('test1234').status_code == 200
+    db.session.refresh(sample_user)
+    assert (sample_user.failed_login_attempts, sample_user.locked_until) == (0, None)
+
+    # A client IP is limited across usernames
+    test_client.application.config['LOGIN_RATE_LIMITS'] = {'ip': (3, 1), 'username': (100, 60)}
+    login_limiter.reset()
+    statuses = [login('wrong', username=f'nobody{i}', ip='10.0.0.9').status_code for i in range(5)]
+    assert statuses == [401, 401, 401, 429, 429]
+    assert 'login_rate_limited_total{scope="ip"} 2' in test_client.get('/metrics').get_data(as_text=True)
+
+
+def test_login_rate_limit_per_forwarded_client(test_app, test_client, init_database):
+    """Test that clients behind the trusted proxy get their own IP buckets."""
+    proxied_app = create_app({
+        'SQLALCHEMY_DATABASE_URI': test_app.config['SQLALCHEMY_DATABASE_URI'],
+        'TESTING': True,
+        'SECRET_KEY': 'test_secret_key',
+        'PROXY_COUNT': 1,
+        'LOGIN_RATE_LIMITS': {'ip': (2, 1), 'username': (100, 60)}
+    })
+
+    def login(client, forwarded_for):
+        return client.post('/login', json={'username': 'nobody', 'password': 'wrong'},
+                           headers={'X-Forwarded-For': forwarded_for}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+
+    proxied = proxied_app.test_client()
+    assert [login(proxied, '203.0.113.1').status_code for _ in range(3)] == [401, 401, 429]
+    assert login(proxied, '203.0.113.2').status_code == 401
+
+    # Without PROXY_COUNT every client shares the proxy's address, so it is not throttled by
+    test_client.application.config['LOGIN_RATE_LIMITS'] = {'ip': (2, 1), 'username': (100, 60)}
+    assert [login(test_client, '203.0.113.3').status_code for _ in range(3)] == [401, 401, 401]
+    with proxied_app.app_context():
+        db.engine.dispose()
+
+
+def test_deleting_account_changes_counterparty_etags(test_client, init_database, sample_user, admin_user):
+    """Test that deleting an account invalidates the ETags of users whose transfers it removes."""
+    alice = {'x-access-token': test_client.post('/login', json={'username': 'testuser', 'password': 'test1234'}).get_json()['token']}
+    bob = {'x-access-token': test_client.post('/login', json={'username': 'admin', 'password': 'adminpass'}).get_json()['token']}
+    source = Account(name='Alice', balance=100.0, currency='USD', country='Spain', user_id=sample_user.id)
+    target = Account(name='Bob', currency='USD', country='Spain', user_id=admin_user.id)
+    db.session.add_all([source, target])
+    db.session.commit()
+    test_client.post('/transactions', json={'from_account_number': source.account_number, 'to_account_number': target.account_number,
+                                            'amount': 10.0, 'currency': 'USD'}, headers=alice)
+
+    response = test_client.get('/transactions', headers=alice)
+    assert len(response.get_json()['transactions']) == 1
+
+    # Bob's account takes Alice's outgoing transfer with it
+    assert test_client.delete(f'/accounts/{target.id}', headers=bob).status_code == 200
+    response = test_client.get('/transactions', headers=dict(alice, **{'If-None-Match': response.headers['ETag']}))
+    assert response.status_code == 200
+    assert response.get_json()['transactions'] == []
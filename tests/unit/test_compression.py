@@ -0,0 +1,62 @@
+import gzip
+import zlib
+import brotli
+from flask import Response
+from iebank_api.compression import compress_response
+
+
+def test_compression_negotiation_and_threshold(test_app):
+    """Test which responses get compressed and with which coding."""
+    body = b'{"transactions": []}' * 100
+
+    with test_app.test_request_context(headers={'Accept-Encoding': 'gzip, br'}):
+        response = compress_response(Response(body, mimetype='application/json'))
+        assert response.headers['Content-Encoding'] == 'br'
+        assert brotli.decompress(response.get_data()) == body
+        assert response.content_length == len(response.get_data())
+
+    with test_app.test_request_context(headers={'Accept-Encoding': 'br;q=0.5, gzip'}):
+        response = Response(body, mimetype='application/json')
+        response.set_etag('abc')
+        response = compress_response(response)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.get_etag() == ('abc-gzip', False)
+        assert gzip.decompress(response.get_data()) == body
+        assert 'Accept-Encoding' in response.vary
+
+    # Too small, not accepted, or not a text type: sent as is
+    for headers, data, mimetype in (
+        ({'Accept-Encoding': 'gzip'}, b'{}', 'application/json'),
+        ({}, body, 'application/json'),
+        ({'Accept-Encoding': 'gzip'}, body, 'image/png')
+    ):
+        with test_app.test_request_context(headers=headers):
+            response = compress_response(Response(data, mimetype=mimetype))
+            assert 'Content-Encoding' not in response.headers
+            assert response.get_data() == data
+
+    test_app.config['COMPRESSION_ENABLED'] = False
+    with test_app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+        assert 'Content-Encoding' not in compress_response(Response(body, mimetype='application/json')).headers
+
+
+def test_streamed_response_is_compressed_per_chunk(test_app):
+    """Test that a streamed body is compressed as it is generated, not buffered."""
+    generated = []
+
+    def generate():
+        for i in range(3):
+            generated.append(i)
+            yield f'{i},row\r\n' * 50
+
+    with test_app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+        response = compress_response(Response(generate(), mimetype='text/csv'))
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in response.headers
+        chunks = response.iter_encoded()
+        first = next(chunks)
+        assert generated == [0]
+        # Each chunk is flushed, so what has arrived so far already decodes
+        assert zlib.decompressobj(31).decompress(first) == b'0,row\r\n' * 50
+        assert gzip.decompress(first + b''.join(chunks)).endswith(b'2,row\r\n')
+        assert generated == [0, 1, 2]
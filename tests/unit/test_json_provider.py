@@ -0,0 +1,28 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+
+def test_orjson_and_stdlib_encode_alike(test_app):
+    """Test that both JSON encoders write the same ISO-8601 output."""
+    payload = {
+        'naive': datetime(2024, 12, 1, 10, 30, 5, 123456),
+        'aware': datetime(2024, 12, 1, 10, 30, 5, tzinfo=timezone.utc),
+        'day': date(1990, 1, 1),
+        'amount': 12.5,
+        'decimal': Decimal('3.10'),
+        'currency': '€',
+        'items': [{'b': 1, 'a': None}]
+    }
+    encoded = {}
+    for use_orjson in (True, False):
+        test_app.config['JSON_USE_ORJSON'] = use_orjson
+        encoded[use_orjson] = test_app.json.dumps(payload)
+        assert test_app.json.loads(encoded[use_orjson])['naive'] == '2024-12-01T10:30:05.123456+00:00'
+
+    assert encoded[True] == encoded[False]
+    data = test_app.json.loads(encoded[True])
+    assert data['aware'] == '2024-12-01T10:30:05+00:00'
+    assert data['day'] == '1990-01-01'
+    assert data['decimal'] == '3.10'
+    assert list(data['items'][0]) == ['a', 'b']
+    assert test_app.json.response(payload).get_data().endswith(b'}\n')
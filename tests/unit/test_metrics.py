@@ -0,0 +1,39 @@
+from iebank_api.metrics import MetricsRegistry, archive_worker, render
+
+
+def test_metrics_aggregate_across_workers(tmp_path):
+    """Test that snapshots written by several workers are merged into one exposition."""
+    first = MetricsRegistry(worker_id='first')
+    second = MetricsRegistry(worker_id='second')
+    first.observe_request('/accounts', 'GET', 200, 0.003)
+    first.inc('http_request_errors_total', {'route': '/accounts', 'status': '500'})
+    second.observe_request('/accounts', 'GET', 200, 0.2)
+    second.observe_request('/accounts', 'GET', 200, 30.0)
+    second.inc('http_request_errors_total', {'route': '/accounts', 'status': '500'})
+    second.flush(tmp_path)
+
+    lines = render(first.collect(tmp_path)).splitlines()
+    labels = 'route="/accounts",method="GET",status="200"'
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.005"}} 1' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.25"}} 2' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="10.0"}} 2' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in lines
+    assert f'http_request_duration_seconds_count{{{labels}}} 3' in lines
+    assert 'http_request_errors_total{route="/accounts",status="500"} 2' in lines
+
+
+def test_exited_workers_are_archived(tmp_path):
+    """Test that exited workers' snapshots are folded into one archive file."""
+    live = MetricsRegistry(worker_id='live')
+    for worker_id in ('1', '2', '3'):
+        worker = MetricsRegistry(worker_id=worker_id)
+        worker.observe_request('/accounts', 'GET', 200, 0.003)
+        worker.inc('http_request_errors_total', {'route': '/accounts', 'status': '500'})
+        worker.flush(tmp_path)
+        archive_worker(tmp_path, worker_id)
+
+    live.observe_request('/accounts', 'GET', 200, 0.003)
+    lines = render(live.collect(tmp_path)).splitlines()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['metrics-archive.json', 'metrics-live.json']
+    assert 'http_request_duration_seconds_count{route="/accounts",method="GET",status="200"} 4' in lines
+    assert 'http_request_errors_total{route="/accounts",status="500"} 3' in lines
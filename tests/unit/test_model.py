@@ -1,6 +1,6 @@
 from datetime import datetime
 from iebank_api import db
-from iebank_api.models import Account, Transaction, User
+from iebank_api.models import Account, Transaction, User, ExchangeRate
 from sqlalchemy.exc import IntegrityError
 import pytest
 
@@ -133,3 +133,50 @@ def test_user_unique_constraints(init_database):
 
     with pytest.raises(IntegrityError):  # Expecting an IntegrityError for duplicates
         db.session.commit()
+
+
+def test_exchange_rate_conversion_matrix(init_database):
+    """Test that stored exchange rates expand into direct, inverse and cross rates."""
+    from iebank_api.fx import exchange_rates
+
+    db.session.add(ExchangeRate(base_currency='EUR', quote_currency='GBP', rate=0.85))
+    db.session.commit()
+    exchange_rates.invalidate()
+
+    assert exchange_rates.rate('EUR', 'GBP') == pytest.approx(0.85)
+    assert exchange_rates.rate('GBP', 'EUR') == pytest.approx(1 / 0.85)
+    # USD/EUR comes from the defaults and chains through EUR
+    assert exchange_rates.rate('USD', 'GBP') == pytest.approx(0.95 * 0.85)
+    assert exchange_rates.rate('GBP', 'USD') == pytest.approx(1 / (0.95 * 0.85))
+    assert exchange_rates.rate('USD', 'JPY') is None
+
+    # Stored rates override the defaults once the cache is refreshed
+    db.session.add(ExchangeRate(base_currency='EUR', quote_currency='USD', rate=1.25))
+    db.session.commit()
+    assert exchange_rates.rate('USD', 'EUR') == pytest.approx(0.95)
+    exchange_rates.refresh()
+    assert exchange_rates.rate('USD', 'EUR') == pytest.approx(0.8)
+
+
+def test_money_is_stored_in_minor_units(init_database, sample_user):
+    """Test that balances and amounts are exact and summed exactly in SQL."""
+    from decimal import Decimal
+
+    account = Account(name='Cents Account', currency='EUR', country='Spain', balance=0.1, user_id=sample_user.id)
+    db.session.add(account)
+    db.session.commit()
+
+    # Ten in-place increments of 0.10 land exactly on 1.10
+    for _ in range(10):
+        db.session.execute(db.update(Account).where(Account.id == account.id).values(balance=Account.balance + Decimal('0.10')))
+    db.session.commit()
+    db.session.refresh(account)
+    assert account.balance == Decimal('1.10')
+
+    stored = db.session.execute(db.text('SELECT balance FROM account WHERE id = :id'), {'id': account.id}).scalar()
+    assert stored == 110
+
+    for amount in ('0.10', '0.20', '0.30'):
+        db.session.add(Transaction(from_account_id=account.id, to_account_id=account.id, amount=amount, currency='EUR'))
+    db.session.commit()
+    assert db.session.execute(db.select(db.func.sum(Transaction.amount))).scalar() == Decimal('0.60')
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from iebank_api.pool_metrics import InstrumentedQueuePool, instrument_pool, pools
+
+
+def test_pool_metrics_track_checkouts_and_waits(tmp_path):
+    """Test the in-use gauges and checkout wait counters of the instrumented pool."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=InstrumentedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.05)
+    metrics = instrument_pool(engine, 'test')
+
+    connection = engine.connect()
+    connection.execute(text('SELECT 1'))
+    snapshot = metrics.snapshot()
+    assert snapshot['in_use'] == 1
+    assert snapshot['size'] == 1
+
+    # The only connection is taken, so the next checkout waits and times out
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    connection.close()
+
+    snapshot = metrics.snapshot()
+    assert snapshot['in_use'] == 0
+    assert snapshot['max_in_use'] == 1
+    assert snapshot['checkout_wait']['count'] == 2
+    assert snapshot['checkout_wait']['timeouts'] == 1
+    assert snapshot['checkout_wait']['max_ms'] >= 50
+    engine.dispose()
+    pools.pop('test')
+
+
+def test_pool_metrics_are_kept_per_engine(tmp_path):
+    """Test that two instrumented engines do not share gauges, even after dispose()."""
+    engines = [create_engine(f"sqlite:///{tmp_path / f'{name}.db'}", poolclass=InstrumentedQueuePool,
+                             pool_size=2, max_overflow=0) for name in ('first', 'second')]
+    first, second = (instrument_pool(engine, name) for engine, name in zip(engines, ('first', 'second')))
+
+    connection = engines[0].connect()
+    assert first.snapshot()['in_use'] == 1
+    assert second.snapshot()['in_use'] == 0
+    connection.close()
+
+    engines[1].dispose()
+    engines[1].connect().close()
+    assert first.snapshot()['checkout_wait']['count'] == 1
+    assert second.snapshot()['checkout_wait']['count'] == 1
+    assert second.snapshot()['checkouts'] == 1
+    for engine, name in zip(engines, ('first', 'second')):
+        engine.dispose()
+        pools.pop(name)
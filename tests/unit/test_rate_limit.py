@@ -0,0 +1,42 @@
+import threading
+from iebank_api.rate_limit import MemoryBackend, SQLiteBackend, consume
+
+
+def test_token_bucket_refills_at_its_rate():
+    """Test the token bucket arithmetic."""
+    tokens, full_at, retry_after = consume(None, 2, 0.5, 100.0)
+    assert (tokens, full_at, retry_after) == (1, 102.0, 0)
+    tokens, _, retry_after = consume((tokens, 100.0), 2, 0.5, 100.0)
+    assert (tokens, retry_after) == (0, 0)
+    tokens, _, retry_after = consume((tokens, 100.0), 2, 0.5, 101.0)
+    assert (tokens, retry_after) == (0.5, 1.0)
+    # Refilling stops at the capacity
+    assert consume((0, 100.0), 2, 0.5, 1000.0)[0] == 1
+
+
+def test_backends_limit_each_key(tmp_path):
+    """Test that both backends allow the burst, then reject until tokens refill."""
+    for backend in (MemoryBackend(), SQLiteBackend(str(tmp_path / 'buckets.db'))):
+        assert [backend.take('user:a', 3, 1, 50.0) for _ in range(4)] == [0, 0, 0, 1.0]
+        assert backend.take('user:b', 3, 1, 50.0) == 0
+        assert backend.take('user:a', 3, 1, 51.0) == 0
+        backend.reset()
+        assert backend.take('user:a', 3, 1, 51.0) == 0
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    """Test that concurrent users of one SQLite file draw from the same buckets."""
+    path = str(tmp_path / 'buckets.db')
+    backends = [SQLiteBackend(path) for _ in range(4)]
+    results = []
+
+    def worker(backend):
+        for _ in range(10):
+            results.append(backend.take('ip:1.2.3.4', 12, 0.001, 50.0))
+
+    threads = [threading.Thread(target=worker, args=(backend,)) for backend in backends]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(0) == 12
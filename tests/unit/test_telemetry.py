@@ -0,0 +1,77 @@
+import logging
+import queue
+import time
+from iebank_api.telemetry import DroppingQueueHandler, detach_telemetry, start_telemetry, dropped_records
+
+
+class SlowHandler(logging.Handler):
+    # Exporter stand-in that records what it receives
+    def __init__(self, delay=0.0):
+        super().__init__()
+        self.delay = delay
+        self.records = []
+
+    def emit(self, record):
+        time.sleep(self.delay)
+        self.records.append(record)
+
+
+def test_queue_handler_drops_when_full():
+    """Test that a full telemetry buffer drops records instead of blocking."""
+    logger = logging.getLogger('test_telemetry_drop')
+    logger.propagate = False
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    logger.addHandler(handler)
+    try:
+        start = time.perf_counter()
+        for i in range(5):
+            logger.warning('record %d', i)
+        assert time.perf_counter() - start < 0.5
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+    finally:
+        logger.removeHandler(handler)
+
+
+def test_request_records_are_structured_and_sampled(test_app, test_client):
+    """Test that request logs reach the exporter off-thread and honour sampling."""
+    exporter = SlowHandler(delay=0.01)
+    listener = start_telemetry(test_app, exporter)
+    try:
+        test_app.config['TELEMETRY_SAMPLE_RATES'] = {'api.hello_world': 0.0}
+        assert test_client.get('/').status_code == 200
+
+        test_app.config['TELEMETRY_SAMPLE_RATES'] = {}
+        assert test_client.get('/').status_code == 200
+        assert test_client.get('/missing').status_code == 404
+    finally:
+        listener.stop()
+        test_app.logger.removeHandler(test_app.extensions['telemetry'])
+
+    requests = [record for record in exporter.records if hasattr(record, 'custom_dimensions')]
+    assert [record.custom_dimensions['status_code'] for record in requests] == [200, 404]
+    assert requests[0].custom_dimensions['route'] == '/'
+    assert requests[0].getMessage().startswith('GET / 200')
+    assert dropped_records(test_app) == 0
+
+
+def test_forked_worker_replaces_telemetry_pipeline(test_app):
+    """Test that a worker drops the inherited pipeline and can start its own."""
+    inherited = start_telemetry(test_app, SlowHandler())
+    inherited_handler = test_app.extensions['telemetry']
+    inherited.stop()
+
+    assert detach_telemetry(test_app)
+    assert inherited_handler not in test_app.logger.handlers
+    # Stopping the abandoned listener at exit must not block on its queue
+    inherited.stop()
+
+    exporter = SlowHandler()
+    listener = start_telemetry(test_app, exporter)
+    try:
+        test_app.logger.info('from the worker')
+    finally:
+        listener.stop()
+        detach_telemetry(test_app)
+    assert [record.getMessage() for record in exporter.records] == ['from the worker']
+    assert not detach_telemetry(test_app)